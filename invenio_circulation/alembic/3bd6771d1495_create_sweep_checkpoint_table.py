@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create the sweep checkpoints table."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3bd6771d1495'
+down_revision = 'e0f7703c2dfe'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'circulation_sweep_checkpoint',
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('value', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint(
+            'name', name=op.f('pk_circulation_sweep_checkpoint')
+        )
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('circulation_sweep_checkpoint')
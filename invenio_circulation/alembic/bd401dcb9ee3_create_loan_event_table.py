@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create the loan events outbox table."""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'bd401dcb9ee3'
+down_revision = 'e3cc4515ce0a'
+branch_labels = ()
+depends_on = None
+
+
+def _json_type():
+    """Return the JSON column type of the dialects."""
+    return sa.JSON().with_variant(
+        sa.dialects.postgresql.JSONB(none_as_null=True), 'postgresql',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'sqlite',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'mysql',
+    )
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'circulation_loan_event',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                  autoincrement=True, nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('loan_id', sqlalchemy_utils.types.uuid.UUIDType(),
+                  nullable=False),
+        sa.Column('src', sa.String(length=64), nullable=False),
+        sa.Column('dest', sa.String(length=64), nullable=False),
+        sa.Column('trigger', sa.String(length=64), nullable=False),
+        sa.Column('loan', _json_type(), nullable=False),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_circulation_loan_event'))
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_table('circulation_loan_event')
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create the idempotency keys table."""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c48022b3e485'
+down_revision = 'bd401dcb9ee3'
+branch_labels = ()
+depends_on = None
+
+
+def _json_type():
+    """Return the JSON column type of the dialects."""
+    return sa.JSON().with_variant(
+        sa.dialects.postgresql.JSONB(none_as_null=True), 'postgresql',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'sqlite',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'mysql',
+    )
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'circulation_idempotency_key',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=False),
+        sa.Column('headers', _json_type(), nullable=False),
+        sa.Column('body', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint(
+            'key', name=op.f('pk_circulation_idempotency_key')
+        )
+    )
+    op.create_index(
+        op.f('ix_circulation_idempotency_key_created'),
+        'circulation_idempotency_key', ['created'], unique=False
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(
+        op.f('ix_circulation_idempotency_key_created'),
+        table_name='circulation_idempotency_key'
+    )
+    op.drop_table('circulation_idempotency_key')
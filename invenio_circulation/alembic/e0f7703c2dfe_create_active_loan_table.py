@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create the active loans table."""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e0f7703c2dfe'
+down_revision = '3fb957c358fe'
+branch_labels = ()
+depends_on = '862037093962'
+
+LOAN_PID_TYPE = 'loanid'
+"""Persistent identifier type of the loans."""
+
+STATES_ITEM_AVAILABLE = ['ITEM_RETURNED']
+"""Default states of the loans not making their item unavailable."""
+
+STATES_LOAN_ACTIVE = [
+    'ITEM_AT_DESK',
+    'ITEM_ON_LOAN',
+    'ITEM_IN_TRANSIT_FOR_PICKUP',
+    'ITEM_IN_TRANSIT_TO_HOUSE',
+]
+"""Default states of the loans holding their item."""
+
+
+def _json_type():
+    """Return the JSON column type of the dialects."""
+    return sa.JSON().with_variant(
+        sa.dialects.postgresql.JSONB(none_as_null=True), 'postgresql',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'sqlite',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'mysql',
+    )
+
+
+def _iter_loans():
+    """Iterate over the identifiers and the data of the existing loans."""
+    records = sa.table(
+        'records_metadata',
+        sa.column('id', sqlalchemy_utils.types.uuid.UUIDType()),
+        sa.column('json', _json_type()),
+    )
+    pids = sa.table(
+        'pidstore_pid',
+        sa.column('pid_type', sa.String()),
+        sa.column('object_uuid', sqlalchemy_utils.types.uuid.UUIDType()),
+    )
+    query = sa.select([records.c.id, records.c.json]).select_from(
+        records.join(pids, pids.c.object_uuid == records.c.id)
+    ).where(pids.c.pid_type == LOAN_PID_TYPE)
+    for loan_id, loan in op.get_bind().execute(query).fetchall():
+        if loan:
+            yield loan_id, loan
+
+
+def _active_loans():
+    """Return the rows of the active loans of the existing loans.
+
+    Only the first loan holding an item keeps it, so that the unique
+    constraint holds even with inconsistent data.
+    """
+    rows = []
+    held_item_pids = set()
+    for loan_id, loan in _iter_loans():
+        item_pid = loan.get('item_pid')
+        if not item_pid or loan.get('state') in STATES_ITEM_AVAILABLE:
+            continue
+        active_item_pid = None
+        if loan['state'] in STATES_LOAN_ACTIVE and \
+                item_pid not in held_item_pids:
+            active_item_pid = item_pid
+            held_item_pids.add(item_pid)
+        rows.append(dict(
+            loan_id=loan_id,
+            item_pid=item_pid,
+            state=loan['state'],
+            active_item_pid=active_item_pid,
+        ))
+    return rows
+
+
+def upgrade():
+    """Upgrade database."""
+    table = op.create_table(
+        'circulation_active_loan',
+        sa.Column('loan_id', sqlalchemy_utils.types.uuid.UUIDType(),
+                  nullable=False),
+        sa.Column('item_pid', sa.String(length=255), nullable=False),
+        sa.Column('state', sa.String(length=64), nullable=False),
+        sa.Column('active_item_pid', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['loan_id'], [u'records_metadata.id'],
+            name=op.f('fk_circulation_active_loan_loan_id_records_metadata'),
+            ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint(
+            'loan_id', name=op.f('pk_circulation_active_loan')
+        ),
+        sa.UniqueConstraint(
+            'active_item_pid',
+            name=op.f('uq_circulation_active_loan_active_item_pid')
+        )
+    )
+    op.create_index(
+        op.f('ix_circulation_active_loan_item_pid'),
+        'circulation_active_loan', ['item_pid'], unique=False
+    )
+    op.bulk_insert(table, _active_loans())
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(
+        op.f('ix_circulation_active_loan_item_pid'),
+        table_name='circulation_active_loan'
+    )
+    op.drop_table('circulation_active_loan')
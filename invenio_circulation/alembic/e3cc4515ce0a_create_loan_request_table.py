@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create the loan requests table."""
+
+from datetime import datetime
+
+import ciso8601
+import pytz
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e3cc4515ce0a'
+down_revision = '3bd6771d1495'
+branch_labels = ()
+depends_on = None
+
+LOAN_PID_TYPE = 'loanid'
+"""Persistent identifier type of the loans."""
+
+
+def _json_type():
+    """Return the JSON column type of the dialects."""
+    return sa.JSON().with_variant(
+        sa.dialects.postgresql.JSONB(none_as_null=True), 'postgresql',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'sqlite',
+    ).with_variant(
+        sqlalchemy_utils.JSONType(), 'mysql',
+    )
+
+
+def _iter_loans():
+    """Iterate over the identifiers and the data of the existing loans."""
+    records = sa.table(
+        'records_metadata',
+        sa.column('id', sqlalchemy_utils.types.uuid.UUIDType()),
+        sa.column('json', _json_type()),
+    )
+    pids = sa.table(
+        'pidstore_pid',
+        sa.column('pid_type', sa.String()),
+        sa.column('object_uuid', sqlalchemy_utils.types.uuid.UUIDType()),
+    )
+    query = sa.select([records.c.id, records.c.json]).select_from(
+        records.join(pids, pids.c.object_uuid == records.c.id)
+    ).where(pids.c.pid_type == LOAN_PID_TYPE)
+    for loan_id, loan in op.get_bind().execute(query).fetchall():
+        if loan:
+            yield loan_id, loan
+
+
+def _request_date(loan):
+    """Return the date of a request as a naive UTC datetime."""
+    if not loan.get('transaction_date'):
+        return datetime.utcnow()
+    date = ciso8601.parse_datetime(loan['transaction_date'])
+    if date.tzinfo is not None:
+        date = date.astimezone(pytz.utc).replace(tzinfo=None)
+    return date
+
+
+def _loan_requests():
+    """Return the rows of the pending requests on documents.
+
+    The requests get the default priority.
+    """
+    return [
+        dict(
+            loan_id=loan_id,
+            document_pid=loan['document_pid'],
+            priority=0,
+            requested_at=_request_date(loan),
+        )
+        for loan_id, loan in _iter_loans()
+        if loan.get('state') == 'PENDING' and not loan.get('item_pid') and
+        loan.get('document_pid')
+    ]
+
+
+def upgrade():
+    """Upgrade database."""
+    table = op.create_table(
+        'circulation_loan_request',
+        sa.Column('loan_id', sqlalchemy_utils.types.uuid.UUIDType(),
+                  nullable=False),
+        sa.Column('document_pid', sa.String(length=255), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('requested_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['loan_id'], [u'records_metadata.id'],
+            name=op.f('fk_circulation_loan_request_loan_id_records_metadata'),
+            ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint(
+            'loan_id', name=op.f('pk_circulation_loan_request')
+        )
+    )
+    op.create_index(
+        'idx_circulation_loan_request_queue', 'circulation_loan_request',
+        ['document_pid', 'priority', 'requested_at'], unique=False
+    )
+    op.bulk_insert(table, _loan_requests())
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(
+        'idx_circulation_loan_request_queue',
+        table_name='circulation_loan_request'
+    )
+    op.drop_table('circulation_loan_request')
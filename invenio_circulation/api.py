@@ -8,12 +8,38 @@
 
 """Circulation API."""
 
-from flask import current_app
+from datetime import datetime
+
+import pytz
+from invenio_db import db
 from invenio_jsonschemas import current_jsonschemas
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_pidstore.resolver import Resolver
 from invenio_records.api import Record
+from invenio_records.models import RecordMetadata
+from sqlalchemy.exc import IntegrityError
 
+from .cache import call_callback
+from .errors import ItemNotAvailable, LoanConflictError
+from .models import ActiveLoan, LoanRequest
+from .proxies import current_circulation
 from .search import LoansSearch
+from .utils import parse_date
+
+_resolvers = {}
+"""PID resolvers of the loan classes."""
+
+
+def _get_resolver(record_class):
+    """Return the cached PID resolver of the given loan class."""
+    from .config import _CIRCULATION_LOAN_PID_TYPE
+    if record_class not in _resolvers:
+        _resolvers[record_class] = Resolver(
+            pid_type=_CIRCULATION_LOAN_PID_TYPE,
+            object_type="rec",
+            getter=record_class.get_record,
+        )
+    return _resolvers[record_class]
 
 
 class Loan(Record):
@@ -23,7 +49,9 @@ class Loan(Record):
 
     def __init__(self, data, model=None):
         """."""
-        self["state"] = current_app.config["CIRCULATION_LOAN_INITIAL_STATE"]
+        self["state"] = current_circulation.settings[
+            "CIRCULATION_LOAN_INITIAL_STATE"
+        ]
         super(Loan, self).__init__(data, model)
 
     @classmethod
@@ -35,69 +63,285 @@ class Loan(Record):
     @classmethod
     def get_record_by_pid(cls, pid, with_deleted=False):
         """Get ils record by pid value."""
-        from .config import _CIRCULATION_LOAN_PID_TYPE
-        resolver = Resolver(
-            pid_type=_CIRCULATION_LOAN_PID_TYPE,
-            object_type="rec",
-            getter=cls.get_record,
-        )
-        persistent_identifier, record = resolver.resolve(str(pid))
+        persistent_identifier, record = _get_resolver(cls).resolve(str(pid))
         return record
 
+    @classmethod
+    def get_records_by_pids(cls, pids, with_deleted=False):
+        """Get the loans of the given pid values with a single query.
+
+        The PIDs and the records are fetched together. Unknown or
+        unregistered PIDs are skipped.
+
+        :param pids: List of loan pid values.
+        :param with_deleted: If `True` then it includes deleted records.
+        :returns: The list of loans, in the order of the given pids.
+        """
+        from .config import _CIRCULATION_LOAN_PID_TYPE
+        pids = [str(pid) for pid in pids]
+        if not pids:
+            return []
+
+        with db.session.no_autoflush:
+            query = db.session.query(
+                PersistentIdentifier.pid_value, RecordMetadata
+            ).join(
+                RecordMetadata,
+                RecordMetadata.id == PersistentIdentifier.object_uuid,
+            ).filter(
+                PersistentIdentifier.pid_type == _CIRCULATION_LOAN_PID_TYPE,
+                PersistentIdentifier.object_type == "rec",
+                PersistentIdentifier.status == PIDStatus.REGISTERED,
+                PersistentIdentifier.pid_value.in_(pids),
+            )
+            if not with_deleted:
+                query = query.filter(RecordMetadata.json != None)  # noqa
+            loans = {
+                pid_value: cls(model.json, model=model)
+                for pid_value, model in query
+            }
+        return [loans[pid] for pid in pids if pid in loans]
+
+
+class LoanView(dict):
+    """Read-only loan hydrated from the source of a loans index hit.
+
+    Building it does not require any database query, which makes it suited
+    for read-only uses such as listing or counting loans. Changes are never
+    persisted: use :meth:`to_loan` to get the writable :class:`Loan`.
+    """
+
+    def __init__(self, hit):
+        """Constructor."""
+        super(LoanView, self).__init__(hit.to_dict())
+        self.id = hit.meta.id
+
+    @classmethod
+    def from_dict(cls, loan_id, data):
+        """Build a view from the id and the data of a loan."""
+        view = cls.__new__(cls)
+        dict.__init__(view, data)
+        view.id = loan_id
+        return view
+
+    def to_loan(self):
+        """Get the writable loan from the database."""
+        return Loan.get_record(self.id)
+
+
+def search_loan_views_by_pid(item_pid=None, document_pid=None,
+                             filter_states=[], exclude_states=[]):
+    """Yield read-only views of the loans of a document or of an item."""
+    for result in LoansSearch.search_loans_by_pid(
+        item_pid=item_pid,
+        document_pid=document_pid,
+        filter_states=filter_states,
+        exclude_states=exclude_states,
+        full_source=True,
+    ):
+        yield LoanView(result)
+
 
 def is_item_available(item_pid):
     """."""
-    config = current_app.config
-    cfg_item_available = config["CIRCULATION_POLICIES"]["checkout"].get(
-        "item_available"
-    )
+    config = current_circulation.settings
+    cfg_item_available = config.policies["checkout"].get("item_available")
     if not cfg_item_available(item_pid):
         return False
 
-    if any(
-        True
-        for loan in LoansSearch.search_loans_by_pid(
-            item_pid=item_pid,
+    if config["CIRCULATION_ITEM_AVAILABILITY_FROM_DB"]:
+        return not ActiveLoan.has_loans(item_pid)
+    return not LoansSearch.has_loans_by_pid(
+        item_pid=item_pid,
+        exclude_states=config.get("CIRCULATION_STATES_ITEM_AVAILABLE"),
+    )
+
+
+def are_items_available(item_pids):
+    """Return a dict telling for each given item pid if it is available.
+
+    Contrary to calling :func:`is_item_available` for each item, the loans of
+    all the items are checked with a single search query.
+    """
+    config = current_circulation.settings
+    cfg_item_available = config.policies["checkout"].get("item_available")
+    availability = {
+        item_pid: bool(cfg_item_available(item_pid)) for item_pid in item_pids
+    }
+
+    candidates = [pid for pid, available in availability.items() if available]
+    if config["CIRCULATION_ITEM_AVAILABILITY_FROM_DB"]:
+        item_pids_with_loans = ActiveLoan.get_item_pids_with_loans(candidates)
+    else:
+        item_pids_with_loans = LoansSearch.get_item_pids_with_loans(
+            candidates,
             exclude_states=config.get("CIRCULATION_STATES_ITEM_AVAILABLE"),
         )
-    ):
-        return False
-    return True
+    for item_pid in item_pids_with_loans:
+        availability[item_pid] = False
+    return availability
+
+
+def lock_loan(loan):
+    """Lock the loan row until the end of the transaction.
+
+    The revision of the loan in the database is compared with the one the
+    loan was read at, so that the changes of a concurrent transaction are
+    not overwritten.
+
+    :raises LoanConflictError: if the loan was changed since it was read.
+    """
+    if loan.model is None:
+        return
+    version_id = db.session.query(RecordMetadata.version_id).filter(
+        RecordMetadata.id == loan.id
+    ).with_for_update().scalar()
+    if version_id is not None and version_id - 1 != loan.revision_id:
+        raise LoanConflictError(
+            msg="Loan `{0}` was changed by another transaction: revision "
+                "`{1}` instead of `{2}`.".format(
+                    loan.id, version_id - 1, loan.revision_id
+                )
+        )
+
+
+def sync_active_loan(loan):
+    """Update the active loans table with the current state of the loan.
+
+    The unique item of the active loans ensures that concurrent
+    transactions cannot make two loans hold the same item.
+
+    :raises ItemNotAvailable: if another loan already holds the item.
+    """
+    config = current_circulation.settings
+    try:
+        with db.session.begin_nested():
+            ActiveLoan.sync(
+                loan,
+                config["CIRCULATION_STATES_ITEM_AVAILABLE"],
+                config["CIRCULATION_STATES_LOAN_ACTIVE"],
+            )
+    except IntegrityError:
+        raise ItemNotAvailable(
+            msg="Item `{0}` is already held by another loan.".format(
+                loan["item_pid"]
+            )
+        )
+
+
+def _iter_loans():
+    """Iterate over all the loan records."""
+    from .config import _CIRCULATION_LOAN_PID_TYPE
+    query = RecordMetadata.query.join(
+        PersistentIdentifier,
+        PersistentIdentifier.object_uuid == RecordMetadata.id,
+    ).filter(
+        PersistentIdentifier.pid_type == _CIRCULATION_LOAN_PID_TYPE,
+        RecordMetadata.json != None,  # noqa
+    )
+    for model in query.yield_per(1000):
+        yield Loan(model.json, model=model)
+
+
+def rebuild_active_loans():
+    """Rebuild the active loans table from all the loan records.
+
+    The changes are not committed, which is left to the caller.
+    """
+    config = current_circulation.settings
+    ActiveLoan.query.delete()
+    for loan in _iter_loans():
+        ActiveLoan.sync(
+            loan,
+            config["CIRCULATION_STATES_ITEM_AVAILABLE"],
+            config["CIRCULATION_STATES_LOAN_ACTIVE"],
+        )
+
+
+def _request_date(loan):
+    """Return the date of a request as a naive UTC datetime."""
+    date = loan.get("transaction_date") or datetime.utcnow()
+    if not isinstance(date, datetime):
+        date = parse_date(date)
+    if date.tzinfo is not None:
+        date = date.astimezone(pytz.utc).replace(tzinfo=None)
+    return date
+
+
+def sync_loan_request(loan):
+    """Update the document requests queue with the current state of the loan.
+
+    The loan is queued while it is a pending request on a document without
+    item, with the priority given by the ``request`` policy.
+    """
+    if loan.get("state") != "PENDING":
+        LoanRequest.sync(loan)
+        return
+    get_priority = current_circulation.settings.policies["request"][
+        "priority"
+    ]
+    LoanRequest.sync(loan, get_priority(loan), _request_date(loan))
+
+
+def rebuild_loan_requests():
+    """Rebuild the document requests queue from all the loan records.
+
+    The changes are not committed, which is left to the caller.
+    """
+    LoanRequest.query.delete()
+    for loan in _iter_loans():
+        sync_loan_request(loan)
+
+
+def get_next_pending_loan_by_doc_pid(document_pid):
+    """Return the next request on a document without item, if any.
+
+    The request is locked until the end of the transaction, so that it is
+    not served twice by concurrent returns.
+    """
+    request = LoanRequest.get_next(document_pid)
+    if request is None:
+        return None
+    return Loan.get_record(request.loan_id)
 
 
 def get_pending_loans_by_item_pid(item_pid):
-    """."""
-    for result in LoansSearch.search_loans_by_pid(
-        item_pid=item_pid, filter_states=["PENDING"]
-    ):
-        yield Loan.get_record_by_pid(result["loanid"])
+    """Return the pending loans of an item, loaded with one query."""
+    return Loan.get_records_by_pids(
+        result["loanid"]
+        for result in LoansSearch.search_loans_by_pid(
+            item_pid=item_pid, filter_states=["PENDING"]
+        )
+    )
 
 
 def get_pending_loans_by_doc_pid(document_pid):
-    """."""
-    for result in LoansSearch.search_loans_by_pid(
-        document_pid=document_pid, filter_states=["PENDING"]
-    ):
-        yield Loan.get_record_by_pid(result["loanid"])
+    """Return the pending loans of a document, loaded with one query."""
+    return Loan.get_records_by_pids(
+        result["loanid"]
+        for result in LoansSearch.search_loans_by_pid(
+            document_pid=document_pid, filter_states=["PENDING"]
+        )
+    )
 
 
 def get_available_item_by_doc_pid(document_pid):
     """Returns an item pid available for this document."""
-    for item_pid in get_items_by_doc_pid(document_pid):
-        if is_item_available(item_pid):
+    item_pids = list(get_items_by_doc_pid(document_pid))
+    availability = are_items_available(item_pids)
+    for item_pid in item_pids:
+        if availability[item_pid]:
             return item_pid
     return None
 
 
 def get_items_by_doc_pid(document_pid):
     """Returns a list of item pids for this document."""
-    return current_app.config["CIRCULATION_ITEMS_RETRIEVER_FROM_DOCUMENT"](
-        document_pid
-    )
+    return current_circulation.settings[
+        "CIRCULATION_ITEMS_RETRIEVER_FROM_DOCUMENT"
+    ](document_pid)
 
 
 def get_document_by_item_pid(item_pid):
     """Return the document pid of this item_pid."""
-    return current_app.config["CIRCULATION_DOCUMENT_RETRIEVER_FROM_ITEM"](
-        item_pid
-    )
+    return call_callback("CIRCULATION_DOCUMENT_RETRIEVER_FROM_ITEM", item_pid)
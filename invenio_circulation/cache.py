@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Scoped cache of the configured circulation callbacks."""
+
+from contextlib import contextmanager
+
+from flask import g
+
+from .proxies import current_circulation
+
+_CACHE_ATTR = '_circulation_callbacks_cache'
+
+
+class CallbacksCache(object):
+    """Memoize the results of the configured callbacks.
+
+    Results are keyed on the callback and its arguments, so that swapping a
+    callback in the configuration never returns a stale value.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self._results = {}
+
+    def get_or_call(self, func, *args):
+        """Return the cached result of ``func(*args)``, call it on miss."""
+        key = (func, args)
+        try:
+            return self._results[key]
+        except KeyError:
+            self._results[key] = func(*args)
+            return self._results[key]
+        except TypeError:
+            # unhashable arguments cannot be cached
+            return func(*args)
+
+    def clear(self):
+        """Drop all cached results."""
+        self._results.clear()
+
+
+@contextmanager
+def callbacks_cache():
+    """Cache the results of the configured callbacks inside the block.
+
+    Nested blocks share the cache opened by the outermost one, which is
+    discarded when it exits.
+    """
+    if _CACHE_ATTR in g:
+        yield getattr(g, _CACHE_ATTR)
+        return
+
+    cache_class = current_circulation.settings.get(
+        'CIRCULATION_CALLBACKS_CACHE'
+    )
+    cache = cache_class() if cache_class else None
+    setattr(g, _CACHE_ATTR, cache)
+    try:
+        yield cache
+    finally:
+        g.pop(_CACHE_ATTR, None)
+
+
+def call_callback(config_key, *args):
+    """Call the callback configured with the given key.
+
+    When a cache is active and the callback is listed in
+    ``CIRCULATION_CACHED_CALLBACKS``, each distinct call is performed once.
+    """
+    settings = current_circulation.settings
+    func = settings[config_key]
+    cache = g.get(_CACHE_ATTR)
+    cached_keys = settings['CIRCULATION_CACHED_CALLBACKS']
+    if cache is None or config_key not in cached_keys:
+        return func(*args)
+    return cache.get_or_call(func, *args)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Circulation CLI."""
+
+import click
+from flask.cli import with_appcontext
+from invenio_db import db
+
+from .api import rebuild_active_loans, rebuild_loan_requests
+from .dispatch import relay_loan_events
+from .errors import LoansIndexNotAliased
+from .export import EXPORT_FORMATS, export_loans
+from .idempotency import purge_idempotency_keys
+from .indexer import reindex_loans
+from .overdue import sweep_overdue_loans
+
+
+@click.group()
+def circulation():
+    """Circulation commands."""
+
+
+@circulation.command('export')
+@click.option('--format', '-f', 'fmt', type=click.Choice(EXPORT_FORMATS),
+              default='ndjson', help='Export format.')
+@click.option('--field', 'fields', multiple=True,
+              help='Loan field to export, can be repeated.')
+@click.option('--state', 'states', multiple=True,
+              help='Only export the loans in this state, can be repeated.')
+@click.option('--slices', type=click.IntRange(min=1), default=1,
+              help='Number of sliced scrolls read concurrently.')
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Output file, standard output by default.')
+@with_appcontext
+def export(fmt, fields, states, slices, output):
+    """Export the loans as NDJSON or CSV."""
+    for line in export_loans(fmt=fmt, fields=fields, states=states,
+                             slices=slices):
+        output.write(line)
+
+
+@circulation.command('overdue')
+@click.option('--batch-size', type=click.IntRange(min=1), default=100,
+              help='Number of loans signaled at once.')
+@with_appcontext
+def overdue(batch_size):
+    """Signal the loans which became overdue since the previous run."""
+    count = sweep_overdue_loans(batch_size=batch_size)
+    click.secho('{0} overdue loans signaled.'.format(count), fg='green')
+
+
+@circulation.command('reindex')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=500,
+              help='Number of loans copied per bulk request.')
+@with_appcontext
+def reindex(chunk_size):
+    """Reindex the loans in a new index with the current mapping."""
+    try:
+        index = reindex_loans(chunk_size=chunk_size)
+    except LoansIndexNotAliased as ex:
+        raise click.ClickException(ex.msg)
+    click.secho('Loans reindexed in {0}.'.format(index), fg='green')
+
+
+@circulation.command('rebuild-active-loans')
+@with_appcontext
+def rebuild_loans():
+    """Rebuild the active loans table from the loan records."""
+    rebuild_active_loans()
+    db.session.commit()
+    click.secho('Active loans rebuilt.', fg='green')
+
+
+@circulation.command('rebuild-queues')
+@with_appcontext
+def rebuild_queues():
+    """Rebuild the queues of the document requests from the loan records."""
+    rebuild_loan_requests()
+    db.session.commit()
+    click.secho('Document requests queues rebuilt.', fg='green')
+
+
+@circulation.command('relay-events')
+@click.option('--batch-size', type=click.IntRange(min=1), default=100,
+              help='Number of loan events delivered at once.')
+@with_appcontext
+def relay_events(batch_size):
+    """Deliver the committed loan events of the outbox."""
+    count = relay_loan_events(batch_size=batch_size)
+    click.secho('{0} loan events relayed.'.format(count), fg='green')
+
+
+@circulation.command('purge-idempotency-keys')
+@with_appcontext
+def purge_keys():
+    """Delete the expired responses of the idempotent loan actions."""
+    count = purge_idempotency_keys()
+    click.secho('{0} idempotency keys purged.'.format(count), fg='green')
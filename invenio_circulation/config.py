@@ -9,7 +9,7 @@
 """Invenio module for the circulation of bibliographic items."""
 
 from invenio_indexer.api import RecordIndexer
-from invenio_records_rest.utils import allow_all
+from invenio_records_rest.utils import allow_all, deny_all
 
 from .api import Loan
 from .links import loan_links_factory
@@ -21,8 +21,9 @@ from .transitions.transitions import CreatedToItemOnLoan, CreatedToPending, \
     PendingToItemInTransitPickup
 from .utils import get_default_extension_duration, \
     get_default_extension_max_count, get_default_loan_duration, \
-    is_item_available, is_loan_duration_valid, item_exists, \
-    item_location_retriever, patron_exists
+    get_default_request_priority, is_item_available, is_loan_duration_valid, \
+    item_category_retriever, item_exists, item_location_retriever, \
+    patron_category_retriever, patron_exists
 
 _CIRCULATION_LOAN_PID_TYPE = 'loanid'
 """."""
@@ -51,6 +52,31 @@ CIRCULATION_PERMISSION_FACTORY = allow_all
 CIRCULATION_STATES_ITEM_AVAILABLE = ['ITEM_RETURNED']
 """."""
 
+CIRCULATION_STATES_LOAN_ACTIVE = [
+    'ITEM_AT_DESK',
+    'ITEM_ON_LOAN',
+    'ITEM_IN_TRANSIT_FOR_PICKUP',
+    'ITEM_IN_TRANSIT_TO_HOUSE',
+]
+"""States in which a loan holds its item.
+
+At most one loan per item can be in one of these states.
+"""
+
+CIRCULATION_STATES_LOAN_OVERDUE = ['ITEM_ON_LOAN']
+"""States in which a loan is overdue once its end date is past."""
+
+CIRCULATION_ITEM_AVAILABILITY_FROM_DB = False
+"""Check the items availability in the database instead of the loans index.
+
+The active loans of each item are always maintained in a table by the
+transitions, which prevents two loans from holding the same item; this only
+makes the availability checks read the table too, so that they are
+transactionally correct. The table is filled from the existing loans when it
+is created by the database migrations, assuming the default loan states. With
+other states, rebuild it with ``invenio circulation rebuild-active-loans``.
+"""
+
 CIRCULATION_LOAN_TRANSITIONS = {
     'CREATED': [
         dict(dest='PENDING', trigger='request', transition=CreatedToPending),
@@ -101,6 +127,25 @@ CIRCULATION_ITEM_EXISTS = item_exists
 CIRCULATION_ITEM_LOCATION_RETRIEVER = item_location_retriever
 """."""
 
+CIRCULATION_CALLBACKS_CACHE = 'invenio_circulation.cache:CallbacksCache'
+"""Cache of the callbacks results during a circulation action.
+
+Set it to ``None`` to disable the cache.
+"""
+
+CIRCULATION_CACHED_CALLBACKS = [
+    'CIRCULATION_ITEM_EXISTS',
+    'CIRCULATION_PATRON_EXISTS',
+    'CIRCULATION_ITEM_LOCATION_RETRIEVER',
+    'CIRCULATION_DOCUMENT_RETRIEVER_FROM_ITEM',
+    'CIRCULATION_PATRON_CATEGORY_RETRIEVER',
+    'CIRCULATION_ITEM_CATEGORY_RETRIEVER',
+]
+"""Configuration keys of the callbacks cached during a circulation action.
+
+Each distinct call to these callbacks is performed once per action.
+"""
+
 CIRCULATION_POLICIES = dict(
     checkout=dict(
         duration_default=get_default_loan_duration,
@@ -112,8 +157,42 @@ CIRCULATION_POLICIES = dict(
         duration_default=get_default_extension_duration,
         max_count=get_default_extension_max_count
     ),
+    request=dict(
+        priority=get_default_request_priority
+    ),
 )
-"""."""
+"""Policies of the circulation actions, by action.
+
+The policy functions, i.e. all the policies but ``from_end_date``, can be
+given as import paths. The other values are used as they are.
+"""
+
+CIRCULATION_POLICY_MATRIX = []
+"""Rules of the policy matrix, or a callable returning them.
+
+Each rule is a dictionary with the ``patron_category``, ``item_category``
+and ``location_pid`` it applies to, missing or ``'*'`` for any value, and
+some of the ``checkout_duration``, ``checkout_duration_max``,
+``extension_duration``, ``extension_max_count`` and ``request_priority``
+policies, used by the default policy functions. See the
+``invenio_circulation.policies`` module.
+"""
+
+CIRCULATION_PATRON_CATEGORY_RETRIEVER = patron_category_retriever
+"""Function returning the category of a patron, for the policy matrix."""
+
+CIRCULATION_ITEM_CATEGORY_RETRIEVER = item_category_retriever
+"""Function returning the category of an item, for the policy matrix."""
+
+CIRCULATION_POLICY_CACHE_SIZE = 1024
+"""Number of criteria combinations whose resolved policies are cached.
+
+The categories and locations are only cached during a circulation action,
+by ``CIRCULATION_CALLBACKS_CACHE``, so that the changes of the patrons and
+items apply from the next action on. Only the rules changes of a callable
+``CIRCULATION_POLICY_MATRIX`` must be signaled with
+``invenio_circulation.signals.policies_changed``.
+"""
 
 CIRCULATION_REST_ENDPOINTS = dict(
     loanid=dict(
@@ -143,3 +222,59 @@ CIRCULATION_REST_ENDPOINTS = dict(
 
 CIRCULATION_REST_PERMISSION_FACTORIES = {}
 """."""
+
+CIRCULATION_LOAN_EVENTS_DISPATCHER = None
+"""Dispatcher of the loan state changes, as a class or an import path.
+
+When set, the ``loan_state_changed`` signal is sent by the dispatcher once
+the transaction is committed instead of synchronously by the transitions.
+See the ``invenio_circulation.dispatch`` module for the available
+dispatchers, among which the transactional outbox.
+
+Concurrent relays of the outbox skip each other's events on PostgreSQL 9.5,
+MySQL 8.0.1, MariaDB 10.6 and later versions. On older versions and on
+SQLite, a relay waits for the events locked by another relay.
+"""
+
+CIRCULATION_LOAN_EVENTS_WORKERS = 4
+"""Number of threads of the thread pool loan events dispatcher.
+
+The thread pool dispatcher keeps the events in memory and delivers them at
+most once: the events still queued when the process is killed are lost. Use
+the outbox dispatcher when each event must be delivered.
+"""
+
+CIRCULATION_LOANS_BULK_INDEXING = True
+"""Send the loans touched by a transition to the indexer bulk queue.
+
+The loans are queued at the end of the request, or when calling
+``invenio_circulation.indexer.flush_loans_indexing_queue()``, and then
+indexed by the ``invenio_indexer`` bulk queue consumer.
+"""
+
+CIRCULATION_BULK_ACTIONS_MAX_SIZE = 500
+"""Maximum number of loan actions accepted by one bulk actions request."""
+
+CIRCULATION_IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+"""Seconds during which the response of a loan action is kept per key.
+
+The expired keys are deleted with ``invenio circulation
+purge-idempotency-keys``.
+"""
+
+CIRCULATION_LOANS_EXPORT_PERMISSION_FACTORY = deny_all
+"""Permission factory of the loans export endpoint, or its import path."""
+
+CIRCULATION_LOANS_EXPORT_FIELDS = [
+    'loanid',
+    'state',
+    'patron_pid',
+    'item_pid',
+    'document_pid',
+    'transaction_date',
+    'transaction_location_pid',
+    'start_date',
+    'end_date',
+    'extension_count',
+]
+"""Loan fields exported in CSV when none are requested."""
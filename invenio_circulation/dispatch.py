@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Asynchronous dispatch of the loan state changes.
+
+When ``CIRCULATION_LOAN_EVENTS_DISPATCHER`` is set, the transitions do not
+send :data:`invenio_circulation.signals.loan_state_changed` themselves: each
+state change is serialized as an event, kept with the database transaction
+and handed to the dispatcher once the transaction is committed. Events of
+rolled back transactions are discarded.
+
+The :class:`OutboxDispatcher` instead writes the events in the
+``circulation_loan_event`` table, in the same transaction as the loans, and
+:func:`relay_loan_events` delivers them in batches once committed.
+
+The receivers then get a read-only :class:`invenio_circulation.api.LoanView`
+of the loan as it was committed.
+"""
+
+import atexit
+import threading
+import zlib
+from collections import deque
+from copy import deepcopy
+
+from flask import current_app
+from invenio_db import db
+from six.moves.queue import Queue
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .api import LoanView
+from .models import LoanEvent
+from .proxies import current_circulation
+from .signals import loan_events_relayed, loan_state_changed
+
+_EVENTS_KEY = '_circulation_loan_events'
+
+
+class LoanEventsDispatcher(object):
+    """Base class of the dispatchers of committed loan events."""
+
+    transactional = False
+    """Get the events within their transaction instead of after commit."""
+
+    def __init__(self, app):
+        """Constructor."""
+        self.app = app
+
+    def dispatch(self, events):
+        """Hand over the events of a committed transaction, in order."""
+        raise NotImplementedError()
+
+
+class LocalQueueDispatcher(LoanEventsDispatcher):
+    """Keep the events in process until :meth:`run` is called.
+
+    Meant for tests, where the events can be delivered at a chosen time.
+    """
+
+    def __init__(self, app):
+        """Constructor."""
+        super(LocalQueueDispatcher, self).__init__(app)
+        self.queue = deque()
+
+    def dispatch(self, events):
+        """Queue the events."""
+        self.queue.extend(events)
+
+    def run(self):
+        """Deliver the queued events, in order.
+
+        :returns: The number of delivered events.
+        """
+        count = 0
+        while self.queue:
+            deliver_loan_event(self.queue.popleft())
+            count += 1
+        return count
+
+
+class ThreadPoolDispatcher(LoanEventsDispatcher):
+    """Deliver the events from a pool of background threads.
+
+    The events of a loan are always delivered by the same thread, so that
+    they are received in the order of the loan transitions. The number of
+    threads is set by ``CIRCULATION_LOAN_EVENTS_WORKERS``.
+
+    The events are only kept in memory: the queued events are delivered
+    when the interpreter exits normally, but are lost if the process is
+    killed, so each event is delivered at most once. Use the
+    :class:`OutboxDispatcher` for a durable delivery.
+    """
+
+    def __init__(self, app):
+        """Constructor."""
+        super(ThreadPoolDispatcher, self).__init__(app)
+        workers_count = app.extensions['invenio-circulation'].settings[
+            'CIRCULATION_LOAN_EVENTS_WORKERS'
+        ]
+        self.queues = [Queue() for _ in range(workers_count)]
+        self.workers = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """Start the worker threads, once."""
+        with self._lock:
+            if self.workers:
+                return
+            for queue in self.queues:
+                worker = threading.Thread(target=self._work, args=(queue, ))
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+            atexit.register(self.join)
+
+    def _work(self, queue):
+        """Deliver the events of a queue."""
+        while True:
+            loan_event = queue.get()
+            try:
+                with self.app.app_context():
+                    deliver_loan_event(loan_event)
+            except Exception:
+                self.app.logger.exception(
+                    'Delivery of loan event failed: {0}'.format(loan_event)
+                )
+            finally:
+                queue.task_done()
+
+    def dispatch(self, events):
+        """Queue each event to the worker of its loan."""
+        self._start()
+        for loan_event in events:
+            key = zlib.crc32(loan_event['loan_id'].encode('utf-8'))
+            self.queues[(key & 0xffffffff) % len(self.queues)].put(loan_event)
+
+    def join(self):
+        """Wait until all the dispatched events are delivered."""
+        for queue in self.queues:
+            queue.join()
+
+
+class OutboxDispatcher(LoanEventsDispatcher):
+    """Write the events in the outbox table, within their transaction.
+
+    The events are then delivered by :func:`relay_loan_events`.
+    """
+
+    transactional = True
+
+    def dispatch(self, events):
+        """Add the events to the outbox."""
+        for loan_event in events:
+            LoanEvent.create(loan_event)
+
+
+def get_loan_events_dispatcher():
+    """Return the configured dispatcher, None when events are synchronous."""
+    dispatcher_class = current_circulation.settings[
+        'CIRCULATION_LOAN_EVENTS_DISPATCHER'
+    ]
+    if not dispatcher_class:
+        return None
+    dispatchers = current_circulation.loan_events_dispatchers
+    if dispatcher_class not in dispatchers:
+        dispatchers[dispatcher_class] = dispatcher_class(
+            current_app._get_current_object()
+        )
+    return dispatchers[dispatcher_class]
+
+
+def deliver_loan_event(loan_event):
+    """Send the ``loan_state_changed`` signal of a serialized event."""
+    transitions = current_circulation.circulation.transitions
+    sender = next((
+        t for t in transitions.get(loan_event['src'], [])
+        if t.dest == loan_event['dest'] and t.trigger == loan_event['trigger']
+    ), None)
+    loan = LoanView.from_dict(loan_event['loan_id'], loan_event['loan'])
+    loan_state_changed.send(sender, loan=loan)
+
+
+def send_loan_state_changed(transition, loan):
+    """Send the ``loan_state_changed`` signal, or schedule it on commit."""
+    dispatcher = get_loan_events_dispatcher()
+    if dispatcher is None:
+        loan_state_changed.send(transition, loan=loan)
+        return
+
+    loan_event = dict(
+        loan_id=str(loan.id),
+        loan=deepcopy(dict(loan)),
+        src=transition.src,
+        dest=transition.dest,
+        trigger=transition.trigger,
+    )
+    if dispatcher.transactional:
+        dispatcher.dispatch([loan_event])
+        return
+
+    session = db.session()
+    events = session.info.setdefault(_EVENTS_KEY, {})
+    events.setdefault(
+        _get_events_transaction(session.transaction), []
+    ).append(loan_event)
+
+
+def _supports_skip_locked(dialect):
+    """Tell if the database can skip the rows locked by a transaction.
+
+    ``SKIP LOCKED`` is supported by PostgreSQL 9.5, MySQL 8.0.1 and MariaDB
+    10.6 onwards.
+    """
+    version = dialect.server_version_info or ()
+    if dialect.name == 'postgresql':
+        return version >= (9, 5)
+    if dialect.name == 'mysql':
+        if getattr(dialect, '_is_mariadb', False):
+            return version >= (10, 6)
+        return version >= (8, 0, 1)
+    return False
+
+
+def relay_loan_events(batch_size=100):
+    """Deliver the committed events of the outbox, in batches.
+
+    Each batch is sent at once with the
+    :data:`invenio_circulation.signals.loan_events_relayed` signal, then
+    event by event with ``loan_state_changed``. The delivered events are
+    deleted in the same transaction, so that a batch whose delivery fails is
+    delivered again by the next relay. Batches locked by a concurrent relay
+    are skipped where the database supports it, and waited for otherwise.
+
+    :returns: The number of delivered events.
+    """
+    app = current_app._get_current_object()
+    skip_locked = _supports_skip_locked(db.session.get_bind().dialect)
+    count = 0
+    while True:
+        rows = LoanEvent.query.order_by(LoanEvent.id).with_for_update(
+            skip_locked=skip_locked
+        ).limit(batch_size).all()
+        if not rows:
+            return count
+
+        events = [row.to_event() for row in rows]
+        loan_events_relayed.send(app, events=events)
+        for loan_event in events:
+            deliver_loan_event(loan_event)
+
+        for row in rows:
+            db.session.delete(row)
+        db.session.commit()
+        count += len(rows)
+
+
+def _get_events_transaction(transaction):
+    """Return the transaction owning the events queued in a transaction.
+
+    Subtransactions are not committed on their own, so their events belong
+    to the closest enclosing savepoint or root transaction.
+    """
+    while transaction.parent is not None and not transaction.nested:
+        transaction = transaction.parent
+    return transaction
+
+
+def _after_commit(session):
+    """Dispatch the events of a committed root transaction.
+
+    The events of a released savepoint are moved to its parent transaction,
+    which can still be rolled back.
+    """
+    events = session.info.get(_EVENTS_KEY)
+    transaction = session.transaction
+    if not events or transaction is None:
+        return
+    committed = events.pop(transaction, None)
+    if not committed:
+        return
+
+    if transaction.parent is None:
+        dispatcher = get_loan_events_dispatcher()
+        if dispatcher is not None:
+            dispatcher.dispatch(committed)
+    else:
+        events.setdefault(
+            _get_events_transaction(transaction.parent), []
+        ).extend(committed)
+
+
+def _after_soft_rollback(session, previous_transaction):
+    """Discard the events of a rolled back transaction."""
+    if previous_transaction.parent is None:
+        session.info.pop(_EVENTS_KEY, None)
+    else:
+        session.info.get(_EVENTS_KEY, {}).pop(previous_transaction, None)
+
+
+def register_session_hooks():
+    """Listen to the transactions of all the database sessions, once.
+
+    The hooks are registered on the session class rather than on
+    ``db.session``, so that they also apply to the sessions created later
+    with ``db.create_scoped_session``.
+    """
+    for name, hook in [('after_commit', _after_commit),
+                       ('after_soft_rollback', _after_soft_rollback)]:
+        if not event.contains(Session, name, hook):
+            event.listen(Session, name, hook)
@@ -8,6 +8,8 @@
 
 """Circulation exceptions."""
 
+from invenio_rest.errors import RESTException
+
 
 class CirculationException(Exception):
     """Exceptions raised by circulation module."""
@@ -37,9 +39,47 @@ class LoanActionError(CirculationException):
     """."""
 
 
+class BulkLoanActionsError(CirculationException):
+    """Raised when the payload of a bulk loan actions request is invalid."""
+
+
 class InvalidCirculationPermission(CirculationException):
     """Raised when permissions are not satisfied for transition."""
 
 
 class TransitionConstraintsViolation(CirculationException):
     """Exception raised when constraints for the transition failed."""
+
+
+class LoanConflictError(CirculationException):
+    """Raised when a loan was changed by a concurrent transaction.
+
+    The action can be retried on the latest revision of the loan.
+    """
+
+
+class IdempotencyKeyError(CirculationException):
+    """Raised when an idempotency key is reused for another request."""
+
+
+class IdempotencyKeyConflictError(CirculationException):
+    """Raised when an idempotency key is used by a request in progress."""
+
+
+class LoansIndexNotAliased(CirculationException):
+    """Raised when the loans index cannot be swapped without downtime."""
+
+
+class InvalidExportFormatError(RESTException):
+    """Raised when the loans are exported in an unknown format."""
+
+    code = 400
+    """HTTP Status code."""
+
+    def __init__(self, fmt, formats, **kwargs):
+        """Initialize exception."""
+        super(InvalidExportFormatError, self).__init__(**kwargs)
+        self.description = \
+            'Invalid export format `{0}`, expected one of: {1}.'.format(
+                fmt, ', '.join(formats)
+            )
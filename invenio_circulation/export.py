@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Streaming export of loans."""
+
+import csv
+import json
+
+from six import StringIO
+
+from .proxies import current_circulation
+from .search import LoansSearch
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+"""Supported export formats."""
+
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+"""Mimetypes of the export formats."""
+
+
+def _csv_value(value):
+    """Convert a loan field value to a CSV cell."""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _csv_line(values):
+    """Serialize one CSV line."""
+    buf = StringIO()
+    csv.writer(buf).writerow([_csv_value(value) for value in values])
+    return buf.getvalue()
+
+
+def export_loans(fmt='ndjson', fields=None, states=None, size=1000,
+                 slices=1):
+    """Stream the loans of the index, one serialized loan at a time.
+
+    The loans are read with a scroll, so that memory usage does not depend
+    on the number of exported loans.
+
+    :param fmt: Export format, one of :data:`EXPORT_FORMATS`.
+    :param fields: Loan fields to export. The whole loans are exported in
+        NDJSON when not given, ``CIRCULATION_LOANS_EXPORT_FIELDS`` in CSV.
+    :param states: Only export the loans in these states.
+    :param size: Number of loans fetched per scroll request.
+    :param slices: Number of sliced scrolls read concurrently, the loans
+        order is not preserved when greater than one.
+    :returns: A generator of serialized lines.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError('Unsupported export format `{0}`.'.format(fmt))
+    if not fields and fmt == 'csv':
+        fields = current_circulation.settings[
+            'CIRCULATION_LOANS_EXPORT_FIELDS'
+        ]
+
+    search = LoansSearch._filter_by_states(LoansSearch(), states)
+    if fields:
+        search = search.source(includes=list(fields))
+    search = search.params(size=size)
+
+    if fmt == 'csv':
+        yield _csv_line(fields)
+    for hit in search.parallel_scan(slices=slices):
+        loan = hit.to_dict()
+        if fmt == 'csv':
+            yield _csv_line(loan.get(field) for field in fields)
+        else:
+            yield json.dumps(loan) + '\n'
@@ -16,8 +16,16 @@ from flask import current_app
 from werkzeug.utils import cached_property
 
 from . import config
+from .api import lock_loan
+from .cache import callbacks_cache
+from .dispatch import register_session_hooks
 from .errors import InvalidState, NoValidTransitionAvailable, \
     TransitionConditionsFailed
+from .indexer import flush_loans_indexing_queue
+from .policies import PolicyMatrix
+from .settings import CirculationSettings
+from .signals import loan_transition_timed
+from .timing import collect_timings
 from .transitions.base import Transition
 from .views import build_blueprint_with_loan_actions
 
@@ -42,6 +50,15 @@ class InvenioCirculation(object):
         )
         blueprint = build_blueprint_with_loan_actions(app)
         app.register_blueprint(blueprint)
+        app.after_request(self.flush_loans_indexing_queue)
+        app.teardown_appcontext(self.teardown_loans_indexing_queue)
+        # loan actions URL paths, by PID type and state
+        self.url_templates = {}
+        # loan events dispatchers, by configured class
+        self.loan_events_dispatchers = {}
+        self.settings = CirculationSettings(app.config)
+        self.policy_matrix = PolicyMatrix.from_settings(self.settings)
+        register_session_hooks()
         app.extensions["invenio-circulation"] = self
 
     def init_config(self, app):
@@ -63,6 +80,31 @@ class InvenioCirculation(object):
         ].items():
             app.config["CIRCULATION_REST_ENDPOINTS"][key].update(item)
 
+    @staticmethod
+    def flush_loans_indexing_queue(response):
+        """Bulk index the loans touched during the request."""
+        flush_loans_indexing_queue()
+        return response
+
+    @staticmethod
+    def teardown_loans_indexing_queue(exception):
+        """Bulk index the loans touched outside of a request.
+
+        For instance by Celery tasks or commands, which have no request.
+        """
+        flush_loans_indexing_queue()
+
+    def reload(self, app=None):
+        """Rebuild the configuration snapshot, policies and state machine.
+
+        To be called after a change of the ``CIRCULATION_*`` configuration.
+        """
+        app = app or current_app
+        self.settings = CirculationSettings(app.config)
+        self.policy_matrix = PolicyMatrix.from_settings(self.settings)
+        self.__dict__.pop("circulation", None)
+        self.url_templates.clear()
+
     @cached_property
     def circulation(self):
         """."""
@@ -79,12 +121,22 @@ class _Circulation(object):
     def __init__(self, transitions_config):
         """."""
         self.transitions = {}
+        # candidate transitions indexed by (source state, trigger)
+        self.dispatch_index = {}
+        # distinct triggers available at each state
+        self.actions_by_state = {}
         for src_state, transitions in transitions_config.items():
             self.transitions.setdefault(src_state, [])
             for t in transitions:
                 _cls = t.pop("transition", Transition)
                 instance = _cls(**dict(t, src=src_state))
                 self.transitions[src_state].append(instance)
+                self.dispatch_index.setdefault(
+                    (src_state, instance.trigger), []
+                ).append(instance)
+                actions = self.actions_by_state.setdefault(src_state, [])
+                if instance.trigger not in actions:
+                    actions.append(instance.trigger)
 
     def _validate_current_state(self, current_state):
         """."""
@@ -92,17 +144,35 @@ class _Circulation(object):
             raise InvalidState("Invalid loan state `{}`".format(current_state))
 
     def trigger(self, loan, **kwargs):
-        """."""
+        """Execute the transition matching the trigger on the loan.
+
+        The loan is locked for the rest of the transaction, so that
+        concurrent actions on the same loan are serialized.
+
+        :raises LoanConflictError: if the loan was changed since it was read.
+        """
+        lock_loan(loan)
         current_state = loan.get("state")
         self._validate_current_state(current_state)
 
-        for t in self.transitions[current_state]:
+        candidates = self.dispatch_index.get(
+            (current_state, kwargs.get("trigger", "next")), []
+        )
+        with callbacks_cache(), collect_timings() as timings:
+            transition = self._execute(loan, current_state, candidates,
+                                       **kwargs)
+        if timings is not None:
+            loan_transition_timed.send(transition, loan=loan, timings=timings)
+        return loan
+
+    def _execute(self, loan, current_state, candidates, **kwargs):
+        """Execute the first candidate transition whose conditions are met."""
+        for t in candidates:
             try:
                 t.execute(loan, **kwargs)
-                return loan
+                return t
             except TransitionConditionsFailed as ex:
                 current_app.logger.debug(ex.msg)
-                pass
 
         raise NoValidTransitionAvailable(
             "No valid transition with current"
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Idempotent loan actions.
+
+A client sending an ``Idempotency-Key`` header with a loan action gets, for
+every retry with the same key, the response of the first successful
+attempt, without the action being performed again. The keys are scoped to
+the authenticated user, and the responses are kept for
+``CIRCULATION_IDEMPOTENCY_KEY_TTL`` seconds.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+from flask import Response, current_app, request
+from invenio_db import db
+from sqlalchemy.exc import IntegrityError
+
+from .errors import IdempotencyKeyConflictError, IdempotencyKeyError
+from .models import IdempotencyKey
+from .proxies import current_circulation
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+
+
+def _expiry_date():
+    """Return the creation date before which the keys are expired."""
+    ttl = current_circulation.settings['CIRCULATION_IDEMPOTENCY_KEY_TTL']
+    return datetime.utcnow() - timedelta(seconds=ttl)
+
+
+def _get_user_id():
+    """Return the id of the authenticated user, or an empty string."""
+    if not hasattr(current_app, 'login_manager'):
+        return ''
+    from flask_login import current_user
+    if not current_user.is_authenticated:
+        return ''
+    return str(current_user.get_id())
+
+
+def request_fingerprint():
+    """Return the hash of the user, method, path and body of the request.
+
+    A key used by another user is then rejected as used for another
+    request, and its response is never returned to them.
+    """
+    digest = hashlib.sha256()
+    for part in (_get_user_id(), request.method, request.path):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def get_stored_response(key):
+    """Return the stored response of an idempotency key, if any.
+
+    An expired key is deleted, so that it can be used again.
+
+    :raises IdempotencyKeyError: if the key was used for another request.
+    """
+    row = IdempotencyKey.query.get(key)
+    if row is None:
+        return None
+    if row.created < _expiry_date():
+        db.session.delete(row)
+        return None
+    if row.fingerprint != request_fingerprint():
+        raise IdempotencyKeyError(
+            msg='Idempotency key `{0}` was used for another request.'
+                .format(key)
+        )
+    return Response(row.body, status=row.status,
+                    headers=[tuple(header) for header in row.headers])
+
+
+def claim_idempotency_key(key):
+    """Claim an idempotency key before performing the action.
+
+    The key is inserted in a savepoint, so that a concurrent request with
+    the same key is stopped here rather than by the loan changes. The claim
+    is only kept if the action is committed, with its response.
+
+    :returns: The stored response of the key if it was already used, None
+        once the key is claimed.
+    :raises IdempotencyKeyError: if the key was used for another request.
+    :raises IdempotencyKeyConflictError: if the key is claimed by a request
+        still in progress.
+    """
+    stored = get_stored_response(key)
+    if stored is not None:
+        return stored
+    try:
+        with db.session.begin_nested():
+            db.session.add(IdempotencyKey(
+                key=key,
+                fingerprint=request_fingerprint(),
+                status=0,
+                headers=[],
+                body=b'',
+            ))
+    except IntegrityError:
+        # claimed since: answer with its response once committed
+        stored = get_stored_response(key)
+        if stored is None:
+            raise IdempotencyKeyConflictError(
+                msg='Idempotency key `{0}` is used by a request in '
+                    'progress.'.format(key)
+            )
+    return stored
+
+
+def store_response(key, response):
+    """Store the response of an idempotency key, in the current transaction.
+
+    The response is then only kept if the action is committed.
+    """
+    row = IdempotencyKey.query.get(key)
+    if row is None:
+        row = IdempotencyKey(key=key, fingerprint=request_fingerprint())
+        db.session.add(row)
+    row.status = response.status_code
+    row.headers = [
+        [name, value] for name, value in response.headers
+        if name.lower() != 'content-length'
+    ]
+    row.body = response.get_data()
+
+
+def purge_idempotency_keys():
+    """Delete the expired idempotency keys.
+
+    :returns: The number of deleted keys.
+    """
+    count = IdempotencyKey.query.filter(
+        IdempotencyKey.created < _expiry_date()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return count
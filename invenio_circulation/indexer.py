@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Circulation loans indexing."""
+
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from elasticsearch.helpers import bulk, scan
+from flask import g
+from invenio_indexer.api import RecordIndexer
+from invenio_pidstore.models import PersistentIdentifier
+from invenio_records.models import RecordMetadata
+from invenio_search import current_search, current_search_client
+from invenio_search.utils import schema_to_index
+
+from .api import Loan
+from .errors import LoansIndexNotAliased
+from .proxies import current_circulation
+
+_QUEUE_ATTR = '_circulation_loans_to_index'
+
+
+def enqueue_loans_for_indexing(loans):
+    """Schedule the given loans to be sent to the indexer bulk queue.
+
+    The loans are sent when :func:`flush_loans_indexing_queue` is called,
+    which happens automatically at the end of each request, or of the
+    application context outside of requests.
+    """
+    if not current_circulation.settings['CIRCULATION_LOANS_BULK_INDEXING']:
+        return
+    queue = g.setdefault(_QUEUE_ATTR, [])
+    queue.extend(str(loan.id) for loan in loans)
+
+
+def flush_loans_indexing_queue():
+    """Send the scheduled loans to the indexer bulk queue.
+
+    :returns: The list of sent loan ids.
+    """
+    loan_ids = list(OrderedDict.fromkeys(g.pop(_QUEUE_ATTR, [])))
+    if loan_ids:
+        RecordIndexer().bulk_index(loan_ids)
+    return loan_ids
+
+
+def _copy_loans(source, target, chunk_size):
+    """Bulk copy the loans of an index to another, keeping their version."""
+    hits = scan(current_search_client, index=source, version=True,
+                size=chunk_size)
+    actions = (
+        {
+            '_index': target,
+            '_type': hit['_type'],
+            '_id': hit['_id'],
+            '_version': hit['_version'],
+            '_version_type': 'external_gte',
+            '_source': hit['_source'],
+        } for hit in hits
+    )
+    return bulk(current_search_client, actions, chunk_size=chunk_size)[0]
+
+
+def _swap_loans_index(alias, index, old_indices):
+    """Point the loans aliases to a new index and delete the old ones.
+
+    :param alias: Name of the loans index, either a concrete index when
+        created by ``invenio_search`` or an alias after a first reindex.
+    :param index: The new index.
+    :param old_indices: Aliases of the old concrete indices, by index.
+    """
+    client = current_search_client
+    aliases = set([alias])
+    for data in old_indices.values():
+        aliases.update(data.get('aliases', {}))
+    actions = [
+        {'add': {'index': index, 'alias': name}} for name in sorted(aliases)
+    ]
+
+    if current_search.cluster_version >= [6, 4]:
+        actions.extend(
+            {'remove_index': {'index': old}} for old in sorted(old_indices)
+        )
+        client.indices.update_aliases(body={'actions': actions})
+        return
+
+    actions.extend(
+        {'remove': {'index': old, 'alias': name}}
+        for old, data in sorted(old_indices.items())
+        for name in sorted(data.get('aliases', {}))
+    )
+    client.indices.update_aliases(body={'actions': actions})
+    for old in old_indices:
+        client.indices.delete(index=old)
+
+
+def reindex_loans(chunk_size=500):
+    """Reindex the loans in a new index created with the current mapping.
+
+    The loans are bulk copied from the current index to a new timestamped
+    one, to which the loans index name is then atomically aliased. The
+    loans updated during the copy are finally indexed again from the
+    database, so that no change is lost while the old index is in use.
+
+    :param chunk_size: Number of loans copied per bulk request.
+    :returns: The name of the new index.
+    :raises LoansIndexNotAliased: if the loans index is a concrete index
+        which the cluster cannot atomically replace with an alias.
+    """
+    from .config import _CIRCULATION_LOAN_PID_TYPE
+    client = current_search_client
+    started = datetime.utcnow()
+    alias, _ = schema_to_index(Loan._schema)
+    index = '{0}-{1}'.format(alias, started.strftime('%Y%m%d%H%M%S%f'))
+
+    old_indices = client.indices.get_alias(index=alias)
+    if alias in old_indices and current_search.cluster_version < [6, 4]:
+        # before 6.4 an index cannot be replaced by an alias atomically
+        raise LoansIndexNotAliased(
+            msg='The loans index `{0}` is not an alias. Copy it to a new '
+                'index and replace it with a `{0}` alias manually, or '
+                'upgrade the cluster to Elasticsearch 6.4 or later.'
+                .format(alias)
+        )
+    old_settings = client.indices.get_settings(index=alias)
+    replicas = max(
+        int(data['settings']['index'].get('number_of_replicas', 1))
+        for data in old_settings.values()
+    )
+
+    with open(current_search.mappings[alias], 'r') as body:
+        client.indices.create(index=index, body=json.load(body))
+    # no refresh nor replication while copying
+    client.indices.put_settings(index=index, body={'index': {
+        'refresh_interval': '-1', 'number_of_replicas': 0,
+    }})
+    _copy_loans(alias, index, chunk_size)
+    client.indices.put_settings(index=index, body={'index': {
+        'refresh_interval': '1s', 'number_of_replicas': replicas,
+    }})
+    client.indices.refresh(index=index)
+
+    _swap_loans_index(alias, index, old_indices)
+
+    updated = PersistentIdentifier.query.join(
+        RecordMetadata,
+        PersistentIdentifier.object_uuid == RecordMetadata.id,
+    ).filter(
+        PersistentIdentifier.pid_type == _CIRCULATION_LOAN_PID_TYPE,
+        RecordMetadata.updated >= started,
+    )
+    indexer = RecordIndexer()
+    for pid in updated.yield_per(1000):
+        indexer.index_by_id(pid.object_uuid)
+    return index
@@ -8,22 +8,78 @@
 
 """Links for record serialization."""
 
-from flask import current_app
+from flask import _request_ctx_stack, current_app
+from werkzeug.urls import url_quote
 
 from .api import Loan
+from .proxies import current_circulation
 from .views import build_url_action_for_pid
 
+_PID_VALUE_PLACEHOLDER = '__loan_pid_value__'
 
-def loan_links_factory(pid, record=None):
-    """Factory for links generation."""
-    links = {}
-    record = record or Loan.get_record(pid.object_uuid)
-    available_actions = {}
-    transitions_config = current_app.config.get(
-        'CIRCULATION_LOAN_TRANSITIONS', {}
-    )
-    for transition in transitions_config.get(record['state']):
-        action = transition.get('trigger', 'next')
-        available_actions[action] = build_url_action_for_pid(pid, action)
-    links.setdefault('available_actions', available_actions)
-    return links
+
+class _PlaceholderPID(object):
+    """PID standing for any loan PID when building URL templates."""
+
+    def __init__(self, pid_type):
+        """Constructor."""
+        self.pid_type = pid_type
+        self.pid_value = _PID_VALUE_PLACEHOLDER
+
+
+def _get_url_templates(pid_type, state):
+    """Return the URL paths of the actions available at a loan state.
+
+    The paths are built once per PID type and state, independently of the
+    host of the request.
+    """
+    key = (pid_type, state)
+    templates = current_circulation.url_templates.get(key)
+    if templates is None:
+        pid = _PlaceholderPID(pid_type)
+        actions = current_circulation.circulation.actions_by_state.get(
+            state, []
+        )
+        templates = {
+            action: build_url_action_for_pid(pid, action, external=False)
+            for action in actions
+        }
+        current_circulation.url_templates[key] = templates
+    return templates
+
+
+def _get_host_url():
+    """Return the scheme and host prefixed to the action URL paths.
+
+    They are the ones ``url_for`` uses for external URLs: the configured
+    ``SERVER_NAME`` if any, else the host of the current request.
+    """
+    reqctx = _request_ctx_stack.top
+    if reqctx is not None:
+        adapter = reqctx.url_adapter
+    else:
+        adapter = current_app.create_url_adapter(None)
+    return '{0}://{1}'.format(adapter.url_scheme, adapter.server_name)
+
+
+def loan_links_factory(pid, record=None, record_hit=None, **kwargs):
+    """Factory for links generation.
+
+    The loan state is read from the record or from the search hit when
+    given, so that the loan is only fetched from the database as a fallback.
+    """
+    if record is not None:
+        state = record['state']
+    elif record_hit is not None:
+        state = record_hit['_source']['state']
+    else:
+        state = Loan.get_record(pid.object_uuid)['state']
+
+    templates = _get_url_templates(pid.pid_type, state)
+    host_url = _get_host_url()
+    pid_value = url_quote(pid.pid_value)
+    available_actions = {
+        action: host_url + template.replace(_PID_VALUE_PLACEHOLDER, pid_value)
+        for action, template in templates.items()
+    }
+    return dict(available_actions=available_actions)
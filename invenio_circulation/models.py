@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Circulation models."""
+
+from datetime import datetime
+
+from invenio_db import db
+from invenio_records.models import RecordMetadata
+from sqlalchemy.dialects import postgresql
+from sqlalchemy_utils.types import JSONType, UUIDType
+
+
+class ActiveLoan(db.Model):
+    """Loans making their item unavailable.
+
+    The table is a transactional index of the loans by item, used to check
+    the availability of the items without querying the search engine.
+    ``active_item_pid`` is only set when the loan holds its item, so that its
+    unique constraint allows at most one such loan per item.
+    """
+
+    __tablename__ = 'circulation_active_loan'
+
+    loan_id = db.Column(
+        UUIDType,
+        db.ForeignKey(RecordMetadata.id, ondelete='CASCADE'),
+        primary_key=True,
+    )
+    """Loan record identifier."""
+
+    item_pid = db.Column(db.String(255), nullable=False, index=True)
+    """Item of the loan."""
+
+    state = db.Column(db.String(64), nullable=False)
+    """Current state of the loan."""
+
+    active_item_pid = db.Column(db.String(255), nullable=True, unique=True)
+    """Item of the loan, only set when the loan holds it."""
+
+    @classmethod
+    def sync(cls, loan, available_states, active_states):
+        """Create, update or delete the row of the given loan.
+
+        :param loan: The loan to index.
+        :param available_states: States of the loans not making their item
+            unavailable, which are removed from the table.
+        :param active_states: States of the loans holding their item.
+        """
+        row = cls.query.get(loan.id)
+        if not loan.get('item_pid') or loan['state'] in available_states:
+            if row is not None:
+                db.session.delete(row)
+            return
+
+        if row is None:
+            row = cls(loan_id=loan.id)
+        row.item_pid = loan['item_pid']
+        row.state = loan['state']
+        row.active_item_pid = loan['item_pid'] \
+            if loan['state'] in active_states else None
+        db.session.add(row)
+
+    @classmethod
+    def get_item_pids_with_loans(cls, item_pids):
+        """Return the subset of the given item pids having a loan."""
+        item_pids = list(item_pids)
+        if not item_pids:
+            return set()
+        query = db.session.query(cls.item_pid).filter(
+            cls.item_pid.in_(item_pids)
+        ).distinct()
+        return set(item_pid for item_pid, in query)
+
+    @classmethod
+    def has_loans(cls, item_pid):
+        """Return True if the given item has a loan, False otherwise."""
+        query = cls.query.filter_by(item_pid=item_pid)
+        return db.session.query(query.exists()).scalar()
+
+
+class LoanRequest(db.Model):
+    """Queue of the pending requests on documents.
+
+    A document request without item waits here until an item of its document
+    is returned. The requests of a document are served by ascending
+    priority, then by request date, which is also the order of the table
+    index, so that finding the next request does not scan the queue.
+    """
+
+    __tablename__ = 'circulation_loan_request'
+    __table_args__ = (
+        db.Index(
+            'idx_circulation_loan_request_queue',
+            'document_pid', 'priority', 'requested_at',
+        ),
+    )
+
+    loan_id = db.Column(
+        UUIDType,
+        db.ForeignKey(RecordMetadata.id, ondelete='CASCADE'),
+        primary_key=True,
+    )
+    """Loan record identifier."""
+
+    document_pid = db.Column(db.String(255), nullable=False)
+    """Requested document."""
+
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    """Priority of the request, lower values are served first."""
+
+    requested_at = db.Column(db.DateTime, nullable=False)
+    """Date, in UTC, of the request."""
+
+    @classmethod
+    def sync(cls, loan, priority=None, requested_at=None):
+        """Add, update or remove the request of the given loan.
+
+        :param loan: The loan to queue, removed from the queue unless it is
+            a pending request on a document without item.
+        :param priority: Priority of the request, required when queued.
+        :param requested_at: Date of the request, required when queued and
+            kept when the loan is already queued.
+        """
+        row = cls.query.get(loan.id)
+        if loan.get('state') != 'PENDING' or loan.get('item_pid') or \
+                not loan.get('document_pid'):
+            if row is not None:
+                db.session.delete(row)
+            return
+
+        if row is None:
+            row = cls(loan_id=loan.id, requested_at=requested_at)
+        row.document_pid = loan['document_pid']
+        row.priority = priority
+        db.session.add(row)
+
+    @classmethod
+    def get_queue(cls, document_pid):
+        """Return the query of the requests on a document, in serving order."""
+        return cls.query.filter_by(document_pid=document_pid).order_by(
+            cls.priority, cls.requested_at, cls.loan_id
+        )
+
+    @classmethod
+    def get_next(cls, document_pid):
+        """Return and lock the next request on a document, if any."""
+        return cls.get_queue(document_pid).with_for_update().first()
+
+
+class SweepCheckpoint(db.Model):
+    """High-water marks of the incremental sweeps over the loans."""
+
+    __tablename__ = 'circulation_sweep_checkpoint'
+
+    name = db.Column(db.String(255), primary_key=True)
+    """Name of the sweep."""
+
+    value = db.Column(db.DateTime, nullable=False)
+    """Date, in UTC, up to which the loans have been processed."""
+
+
+class LoanEvent(db.Model):
+    """Outbox of the loan state changes.
+
+    The events are written in the same transaction as their loan and read
+    back by the relay once committed, in insertion order.
+    """
+
+    __tablename__ = 'circulation_loan_event'
+
+    id = db.Column(
+        db.BigInteger().with_variant(db.Integer, 'sqlite'),
+        primary_key=True,
+        autoincrement=True,
+    )
+    """Event identifier, increasing with the insertion order."""
+
+    created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    """Date, in UTC, of the state change."""
+
+    loan_id = db.Column(UUIDType, nullable=False)
+    """Loan record identifier."""
+
+    src = db.Column(db.String(64), nullable=False)
+    """Previous state of the loan."""
+
+    dest = db.Column(db.String(64), nullable=False)
+    """New state of the loan."""
+
+    trigger = db.Column(db.String(64), nullable=False)
+    """Trigger of the transition."""
+
+    loan = db.Column(
+        db.JSON().with_variant(
+            postgresql.JSONB(none_as_null=True),
+            'postgresql',
+        ).with_variant(
+            JSONType(),
+            'sqlite',
+        ).with_variant(
+            JSONType(),
+            'mysql',
+        ),
+        nullable=False,
+    )
+    """Loan data after the transition."""
+
+    @classmethod
+    def create(cls, loan_event):
+        """Add a serialized loan event to the outbox."""
+        row = cls(
+            loan_id=loan_event['loan_id'],
+            src=loan_event['src'],
+            dest=loan_event['dest'],
+            trigger=loan_event['trigger'],
+            loan=loan_event['loan'],
+        )
+        db.session.add(row)
+        return row
+
+    def to_event(self):
+        """Return the serialized loan event."""
+        return dict(
+            loan_id=str(self.loan_id),
+            loan=self.loan,
+            src=self.src,
+            dest=self.dest,
+            trigger=self.trigger,
+        )
+
+
+class IdempotencyKey(db.Model):
+    """Responses of the loan actions, by idempotency key.
+
+    A retried action with the same key is answered from the stored response
+    instead of being performed again.
+    """
+
+    __tablename__ = 'circulation_idempotency_key'
+
+    key = db.Column(db.String(255), primary_key=True)
+    """Idempotency key sent by the client."""
+
+    fingerprint = db.Column(db.String(64), nullable=False)
+    """Hash of the request the key was first used for."""
+
+    created = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False, index=True
+    )
+    """Date, in UTC, of the first request."""
+
+    status = db.Column(db.Integer, nullable=False)
+    """Status code of the response."""
+
+    headers = db.Column(
+        db.JSON().with_variant(
+            postgresql.JSONB(none_as_null=True),
+            'postgresql',
+        ).with_variant(
+            JSONType(),
+            'sqlite',
+        ).with_variant(
+            JSONType(),
+            'mysql',
+        ),
+        nullable=False,
+    )
+    """Headers of the response, as a list of pairs."""
+
+    body = db.Column(db.LargeBinary, nullable=False)
+    """Body of the response."""
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Detection of overdue loans."""
+
+from datetime import datetime
+
+import pytz
+from flask import current_app
+from invenio_db import db
+from sqlalchemy.exc import IntegrityError
+
+from .api import LoanView
+from .models import SweepCheckpoint
+from .proxies import current_circulation
+from .search import LoansSearch
+from .signals import loans_overdue
+
+OVERDUE_CHECKPOINT = 'overdue-loans'
+"""Name of the overdue loans sweep checkpoint."""
+
+
+def _to_utc(date):
+    """Return an aware UTC datetime, naive ones are assumed to be UTC."""
+    if date.tzinfo is None:
+        return pytz.utc.localize(date)
+    return date.astimezone(pytz.utc)
+
+
+def get_overdue_loans(since=None, until=None, batch_size=100):
+    """Yield batches of the loans on loan with an end date in a range.
+
+    The loans are paginated with ``search_after``, sorted by end date, so
+    that no scroll context is kept open between the batches.
+
+    :param since: Only return loans ending at or after this date.
+    :param until: Only return loans ending before this date, now by default.
+    :param batch_size: Number of loans per batch.
+    """
+    until = _to_utc(until or datetime.utcnow())
+    end_date_range = dict(lt=until.isoformat(), format='date_optional_time')
+    if since:
+        end_date_range['gte'] = _to_utc(since).isoformat()
+
+    search = LoansSearch._filter_by_states(
+        LoansSearch(),
+        current_circulation.settings['CIRCULATION_STATES_LOAN_OVERDUE'],
+    )
+    search = search.filter('range', end_date=end_date_range)
+    search = search.sort('end_date', 'loanid')[0:batch_size]
+
+    search_after = None
+    while True:
+        page = search
+        if search_after:
+            page = search.extra(search_after=search_after)
+        hits = page.execute().hits
+        if not len(hits):
+            return
+        yield [LoanView(hit) for hit in hits]
+        if len(hits) < batch_size:
+            return
+        search_after = list(hits[-1].meta.sort)
+
+
+def lock_sweep_checkpoint(name, value):
+    """Return the checkpoint of a sweep, locked until the transaction ends.
+
+    A missing checkpoint is created with the given value. When a concurrent
+    transaction creates it first, the insert waits for that transaction and
+    the checkpoint it committed is returned instead.
+
+    :returns: The checkpoint, and True if it was created.
+    """
+    query = SweepCheckpoint.query.filter_by(name=name).with_for_update()
+    checkpoint = query.one_or_none()
+    if checkpoint is not None:
+        return checkpoint, False
+    checkpoint = SweepCheckpoint(name=name, value=value)
+    try:
+        with db.session.begin_nested():
+            db.session.add(checkpoint)
+    except IntegrityError:
+        return query.one(), False
+    return checkpoint, True
+
+
+def sweep_overdue_loans(batch_size=100, now=None):
+    """Signal the loans which became overdue since the previous sweep.
+
+    A :data:`invenio_circulation.signals.loans_overdue` signal is sent for
+    each batch of loans. The end of the swept range is then saved as the
+    start of the next sweep, so that each loan is signaled once.
+
+    :returns: The number of signaled loans.
+    """
+    now = _to_utc(now or datetime.utcnow())
+    checkpoint, created = lock_sweep_checkpoint(
+        OVERDUE_CHECKPOINT, now.replace(tzinfo=None)
+    )
+    since = None if created else checkpoint.value
+
+    count = 0
+    sender = current_app._get_current_object()
+    for batch in get_overdue_loans(since=since, until=now,
+                                   batch_size=batch_size):
+        loans_overdue.send(sender, loans=batch)
+        count += len(batch)
+
+    checkpoint.value = now.replace(tzinfo=None)
+    db.session.commit()
+    return count
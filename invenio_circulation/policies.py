@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Circulation policy matrix.
+
+The policies of a loan depend on the category of its patron, the category of
+its item and the location of its item. ``CIRCULATION_POLICY_MATRIX`` lists
+rules giving policy values for a combination of these criteria, where a
+missing or ``'*'`` criterion matches any value. For each policy, the most
+specific rule giving it wins: the patron category is more specific than the
+item category, itself more specific than the location.
+
+The rules are compiled in a table keyed by criteria, and the resolved
+policies are kept in a least recently used cache, so that resolving the
+policies of a loan does not scan the rules again. The cache is emptied by the
+:data:`invenio_circulation.signals.policies_changed` signal.
+
+The retrievers are called through
+:func:`invenio_circulation.cache.call_callback`, and only for the criteria
+used by the rules, so that the categories and locations are retrieved once
+per circulation action. Changes of the patrons and items then apply from the
+next action on.
+"""
+
+import threading
+from collections import OrderedDict
+from itertools import product
+
+from .cache import call_callback
+from .proxies import current_circulation
+from .settings import FrozenDict
+from .signals import policies_changed
+
+ANY = '*'
+"""Criterion value of a rule matching any value."""
+
+CRITERIA = ('patron_category', 'item_category', 'location_pid')
+"""Criteria of the rules, from the most to the least specific."""
+
+_SPECIFICITY = list(product((True, False), repeat=len(CRITERIA)))
+"""Criteria kept in the lookup keys, from the most to the least specific."""
+
+_RETRIEVERS = (
+    ('patron_pid', 'CIRCULATION_PATRON_CATEGORY_RETRIEVER'),
+    ('item_pid', 'CIRCULATION_ITEM_CATEGORY_RETRIEVER'),
+    ('item_pid', 'CIRCULATION_ITEM_LOCATION_RETRIEVER'),
+)
+"""Loan field and retriever of each criterion."""
+
+_MISSING = object()
+
+_NO_POLICIES = FrozenDict({})
+
+
+class LRUCache(object):
+    """Least recently used cache, safe to share between threads."""
+
+    def __init__(self, maxsize):
+        """Constructor."""
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return a cached value, marking it as the most recently used."""
+        with self._lock:
+            value = self._data.pop(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        """Cache a value, evicting the least recently used one if full."""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        """Forget a cached value."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Forget all the cached values."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        """Return the number of cached values."""
+        return len(self._data)
+
+
+def compile_rules(rules):
+    """Return the policies of the rules, keyed by their criteria.
+
+    The policies of the rules having the same criteria are merged, the last
+    rule winning.
+    """
+    table = {}
+    for rule in rules:
+        values = dict(rule)
+        key = tuple(values.pop(name, ANY) for name in CRITERIA)
+        table.setdefault(key, {}).update(values)
+    return dict((key, FrozenDict(values)) for key, values in table.items())
+
+
+class PolicyMatrix(object):
+    """Resolve the policies of the loans from the rules of the matrix."""
+
+    def __init__(self, rules, cache_size=1024):
+        """Constructor.
+
+        :param rules: The rules, or a callable returning them.
+        :param cache_size: Number of cached criteria combinations.
+        """
+        self.rules = rules
+        self._table = None
+        self._used = None
+        self._lock = threading.Lock()
+        self._policies = LRUCache(cache_size)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build the matrix of a configuration snapshot."""
+        return cls(
+            settings['CIRCULATION_POLICY_MATRIX'],
+            cache_size=settings['CIRCULATION_POLICY_CACHE_SIZE'],
+        )
+
+    def _compile(self):
+        """Compile the rules, once."""
+        with self._lock:
+            if self._table is None:
+                rules = self.rules() if callable(self.rules) else self.rules
+                table = compile_rules(rules)
+                self._used = tuple(
+                    any(key[index] != ANY for key in table)
+                    for index in range(len(CRITERIA))
+                )
+                self._table = table
+            return self._table, self._used
+
+    @property
+    def table(self):
+        """Compiled rules, keyed by criteria."""
+        table = self._table
+        if table is None:
+            table, _ = self._compile()
+        return table
+
+    @property
+    def used_criteria(self):
+        """Tell for each criterion if a rule depends on it."""
+        used = self._used
+        if used is None:
+            _, used = self._compile()
+        return used
+
+    def resolve(self, patron_category, item_category, location_pid):
+        """Return the policies matching the given criteria."""
+        criteria = (patron_category, item_category, location_pid)
+        policies = self._policies.get(criteria)
+        if policies is None:
+            table = self.table
+            values = {}
+            for keep in reversed(_SPECIFICITY):
+                key = tuple(
+                    value if kept else ANY
+                    for value, kept in zip(criteria, keep)
+                )
+                values.update(table.get(key, {}))
+            policies = FrozenDict(values)
+            self._policies.set(criteria, policies)
+        return policies
+
+    def get_criterion(self, config_key, pid):
+        """Return the result of a criterion retriever.
+
+        The retriever is called with ``call_callback``, so that its calls
+        are cached during a circulation action and shared with the
+        transitions.
+        """
+        return call_callback(config_key, pid) or None
+
+    def get_loan_policies(self, loan):
+        """Return the policies of a loan.
+
+        No retriever is called for the criteria not used by any rule.
+        """
+        if not self.table:
+            return _NO_POLICIES
+        criteria = []
+        for (field, config_key), used in zip(_RETRIEVERS, self.used_criteria):
+            pid = loan.get(field)
+            criteria.append(
+                self.get_criterion(config_key, pid) if used and pid else None
+            )
+        return self.resolve(*criteria)
+
+    def invalidate(self):
+        """Forget the compiled rules and the cached policies."""
+        with self._lock:
+            self._table = None
+            self._used = None
+        self._policies.clear()
+
+
+def get_loan_policy(loan, name, default=None):
+    """Return a policy of a loan from the policy matrix."""
+    policies = current_circulation.policy_matrix.get_loan_policies(loan)
+    return policies.get(name, default)
+
+
+@policies_changed.connect
+def invalidate_policies(sender, **kwargs):
+    """Empty the cache of the policy matrix on policy changes."""
+    current_circulation.policy_matrix.invalidate()
@@ -8,8 +8,25 @@
 
 """Search utilities."""
 
+import sys
+from threading import Event, Thread
+
+import six
 from elasticsearch_dsl.query import Bool, Q
+from flask import current_app
 from invenio_search.api import RecordsSearch
+from six.moves.queue import Full, Queue
+
+
+class _SliceFailed(object):
+    """Error raised while scrolling a slice, to be re-raised by the reader."""
+
+    def __init__(self, exc_info):
+        """Constructor."""
+        self.exc_info = exc_info
+
+
+_SLICE_DONE = object()
 
 
 class LoansSearch(RecordsSearch):
@@ -21,12 +38,9 @@ class LoansSearch(RecordsSearch):
         index = 'loans'
         doc_types = None
 
-    @classmethod
-    def search_loans_by_pid(cls, item_pid=None, document_pid=None,
-                            filter_states=[], exclude_states=[]):
-        """."""
-        search = cls()
-
+    @staticmethod
+    def _filter_by_states(search, filter_states=[], exclude_states=[]):
+        """Restrict the search to the given loan states."""
         if filter_states:
             search = search.query(
                 Bool(filter=[Q('terms', state=filter_states)])
@@ -35,16 +49,139 @@ class LoansSearch(RecordsSearch):
             search = search.query(
                 Bool(filter=[~Q('terms', state=exclude_states)])
             )
+        return search
+
+    @classmethod
+    def _search_by_pid(cls, item_pid=None, document_pid=None,
+                       filter_states=[], exclude_states=[]):
+        """Build the search of the loans of a document or of an item."""
+        search = cls._filter_by_states(cls(), filter_states, exclude_states)
 
         if document_pid:
-            search = search.filter('term', document_pid=document_pid).source(
-                includes='loanid'
-            )
+            search = search.filter('term', document_pid=document_pid)
         elif item_pid:
-            search = search.filter('term', item_pid=item_pid).source(
-                includes='loanid'
-            )
+            search = search.filter('term', item_pid=item_pid)
+        return search
+
+    @classmethod
+    def search_loans_by_pid(cls, item_pid=None, document_pid=None,
+                            filter_states=[], exclude_states=[],
+                            full_source=False):
+        """Scan the loans of a document or of an item.
+
+        Only the ``loanid`` of the hits is returned, unless ``full_source`` is
+        set.
+        """
+        search = cls._search_by_pid(item_pid=item_pid,
+                                    document_pid=document_pid,
+                                    filter_states=filter_states,
+                                    exclude_states=exclude_states)
+        if (document_pid or item_pid) and not full_source:
+            search = search.source(includes='loanid')
 
         for result in search.scan():
             if result.loanid:
                 yield result
+
+    @classmethod
+    def has_loans_by_pid(cls, item_pid=None, document_pid=None,
+                         filter_states=[], exclude_states=[]):
+        """Return True if at least one loan matches, False otherwise.
+
+        Unlike :meth:`search_loans_by_pid`, no scroll context is opened and
+        no hit is fetched: the shards stop searching after the first match.
+        """
+        search = cls._search_by_pid(item_pid=item_pid,
+                                    document_pid=document_pid,
+                                    filter_states=filter_states,
+                                    exclude_states=exclude_states)
+        search = search[0:0].extra(terminate_after=1)
+        return search.execute().hits.total > 0
+
+    @classmethod
+    def get_item_pids_with_loans(cls, item_pids, filter_states=[],
+                                 exclude_states=[]):
+        """Return the subset of the given item pids having at least one loan.
+
+        All the items are resolved with a single aggregation query, no hits
+        are fetched.
+        """
+        item_pids = list(item_pids)
+        if not item_pids:
+            return set()
+
+        search = cls._filter_by_states(cls()[0:0], filter_states,
+                                       exclude_states)
+        search = search.filter('terms', item_pid=item_pids)
+        search.aggs.bucket(
+            'item_pids', 'terms', field='item_pid', size=len(item_pids)
+        )
+        result = search.execute()
+        return set(
+            bucket.key for bucket in result.aggregations.item_pids.buckets
+        )
+
+    def parallel_scan(self, slices=2, buffer_size=1000):
+        """Iterate over all the hits with concurrent sliced scrolls.
+
+        The search is split in ``slices`` sliced scrolls, each one read by
+        its own thread, so that a full pass over the index is not bound to a
+        single scroll cursor. The hits are yielded as they arrive, their
+        order is not preserved.
+
+        :param slices: Number of slices, one thread is started for each.
+        :param buffer_size: Maximum number of hits fetched but not yet
+            consumed.
+        """
+        if slices < 2:
+            for hit in self.scan():
+                yield hit
+            return
+
+        app = current_app._get_current_object()
+        results = Queue(maxsize=buffer_size)
+        stop = Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def scan_slice(search):
+            try:
+                with app.app_context():
+                    for hit in search.scan():
+                        if not put(hit):
+                            return
+            except Exception:
+                put(_SliceFailed(sys.exc_info()))
+            finally:
+                put(_SLICE_DONE)
+
+        threads = [
+            Thread(
+                target=scan_slice,
+                args=(self.extra(slice={'id': i, 'max': slices}),),
+            )
+            for i in range(slices)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            running = slices
+            while running:
+                item = results.get()
+                if item is _SLICE_DONE:
+                    running -= 1
+                elif isinstance(item, _SliceFailed):
+                    six.reraise(*item.exc_info)
+                else:
+                    yield item
+        finally:
+            stop.set()
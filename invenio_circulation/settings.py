@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Immutable snapshot of the circulation configuration."""
+
+import six
+from werkzeug.utils import import_string
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+_CALLABLE_KEYS = (
+    'CIRCULATION_CALLBACKS_CACHE',
+    'CIRCULATION_DOCUMENT_RETRIEVER_FROM_ITEM',
+    'CIRCULATION_ITEMS_RETRIEVER_FROM_DOCUMENT',
+    'CIRCULATION_ITEM_CATEGORY_RETRIEVER',
+    'CIRCULATION_ITEM_EXISTS',
+    'CIRCULATION_ITEM_LOCATION_RETRIEVER',
+    'CIRCULATION_LOANS_EXPORT_PERMISSION_FACTORY',
+    'CIRCULATION_LOAN_EVENTS_DISPATCHER',
+    'CIRCULATION_PATRON_CATEGORY_RETRIEVER',
+    'CIRCULATION_PATRON_EXISTS',
+    'CIRCULATION_PERMISSION_FACTORY',
+    'CIRCULATION_POLICY_MATRIX',
+)
+"""Configuration keys whose import strings are resolved."""
+
+_CALLABLE_POLICIES = dict(
+    checkout=('duration_default', 'duration_validate', 'item_available'),
+    extension=('duration_default', 'max_count'),
+    request=('priority', ),
+)
+"""Names of the policies, by section, whose import strings are resolved."""
+
+
+class FrozenDict(Mapping):
+    """Read-only dictionary."""
+
+    __slots__ = ('_data', )
+
+    def __init__(self, data):
+        """Constructor."""
+        self._data = dict(data)
+
+    def __getitem__(self, key):
+        """Get a value."""
+        return self._data[key]
+
+    def __iter__(self):
+        """Iterate over the keys."""
+        return iter(self._data)
+
+    def __len__(self):
+        """Return the number of keys."""
+        return len(self._data)
+
+    def __repr__(self):
+        """Representation."""
+        return 'FrozenDict({0!r})'.format(self._data)
+
+
+def _resolve(value):
+    """Import a configuration value given as an import string."""
+    if isinstance(value, six.string_types):
+        return import_string(value)
+    return value
+
+
+def _freeze(value):
+    """Return a read-only copy of a configuration value."""
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class CirculationSettings(FrozenDict):
+    """Snapshot of the ``CIRCULATION_*`` configuration.
+
+    It is built once from the application configuration, with the import
+    strings of the callbacks and of the policy functions resolved, so that
+    the hot paths do not go through ``current_app.config`` on each call. The
+    other values, including the other policies, are kept as they are. It must
+    be rebuilt with :meth:`invenio_circulation.ext.InvenioCirculation.reload`
+    when the configuration changes.
+    """
+
+    __slots__ = ('policies', 'states')
+
+    def __init__(self, config):
+        """Constructor."""
+        values = {}
+        for key, value in config.items():
+            if not key.startswith('CIRCULATION_'):
+                continue
+            if key in _CALLABLE_KEYS:
+                value = _resolve(value)
+            values[key] = value
+        values['CIRCULATION_POLICIES'] = dict(
+            (section, dict(
+                (name, _resolve(policy)
+                 if name in _CALLABLE_POLICIES.get(section, ()) else policy)
+                for name, policy in policies.items()
+            ))
+            for section, policies in values['CIRCULATION_POLICIES'].items()
+        )
+        super(CirculationSettings, self).__init__(
+            (key, _freeze(value)) for key, value in values.items()
+        )
+        self.policies = self['CIRCULATION_POLICIES']
+        """Policies, by section and name."""
+        self.states = frozenset(self['CIRCULATION_LOAN_TRANSITIONS'])
+        """States of the loans."""
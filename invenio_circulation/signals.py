@@ -17,3 +17,36 @@ loan_state_changed = _signals.signal('loan-state-changed')
 
 Its is broadcasted when a loan transitions to a different state.
 """
+
+loans_overdue = _signals.signal('loans-overdue')
+"""Loans overdue signal.
+
+It is broadcasted with a batch of loans which became overdue since the
+previous sweep, given as read-only loans in the ``loans`` parameter.
+"""
+
+loan_transition_timed = _signals.signal('loan-transition-timed')
+"""Loan transition timed signal.
+
+It is broadcasted by each successfully triggered transition, given as
+sender, with the ``loan`` and the ``timings`` of the transition phases, in
+seconds by phase name. The phases are only timed when the signal has
+receivers.
+"""
+
+loan_events_relayed = _signals.signal('loan-events-relayed')
+"""Loan events relayed signal.
+
+It is broadcasted by the relay of the loan events outbox with a batch of
+committed loan state changes, given as dictionaries in the ``events``
+parameter.
+"""
+
+policies_changed = _signals.signal('policies-changed')
+"""Circulation policies changed signal.
+
+It is to be broadcasted when the rules of the policy matrix change, so that
+all the cached policies are forgotten. The categories of patrons and items
+are retrieved again by each circulation action, so their changes need no
+signal.
+"""
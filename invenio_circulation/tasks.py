@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Circulation Celery tasks."""
+
+from celery import shared_task
+
+from .dispatch import relay_loan_events
+from .idempotency import purge_idempotency_keys
+from .overdue import sweep_overdue_loans
+
+
+@shared_task(ignore_result=True)
+def sweep_overdue_loans_task(batch_size=100):
+    """Signal the loans which became overdue since the previous sweep."""
+    return sweep_overdue_loans(batch_size=batch_size)
+
+
+@shared_task(ignore_result=True)
+def relay_loan_events_task(batch_size=100):
+    """Deliver the committed loan events of the outbox."""
+    return relay_loan_events(batch_size=batch_size)
+
+
+@shared_task(ignore_result=True)
+def purge_idempotency_keys_task():
+    """Delete the expired responses of the idempotent loan actions."""
+    return purge_idempotency_keys()
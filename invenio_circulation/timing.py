@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Timing of the phases of the loan transitions.
+
+The timed phases of a trigger are:
+
+- ``before``: validation of the parameters, permission and conditions of
+  the tried transitions, including the ones whose conditions failed.
+- ``after``: everything done once the loan has its new state, which
+  includes the ``commit`` and ``signal`` phases.
+- ``commit``: update of the circulation tables and of the loan record.
+- ``signal``: the ``loan_state_changed`` receivers.
+- ``trigger``: the whole trigger.
+"""
+
+from contextlib import contextmanager
+from timeit import default_timer
+
+from flask import g
+
+from .signals import loan_transition_timed
+
+_TIMINGS_ATTR = '_circulation_transition_timings'
+
+
+@contextmanager
+def collect_timings():
+    """Collect the timings of the phases of a trigger.
+
+    :returns: The dictionary of the timings, or None when the
+        :data:`invenio_circulation.signals.loan_transition_timed` signal has
+        no receivers.
+    """
+    if not loan_transition_timed.receivers:
+        yield None
+        return
+
+    previous = g.get(_TIMINGS_ATTR)
+    timings = {}
+    setattr(g, _TIMINGS_ATTR, timings)
+    start = default_timer()
+    try:
+        yield timings
+    finally:
+        timings['trigger'] = default_timer() - start
+        setattr(g, _TIMINGS_ATTR, previous)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to a phase of the current trigger."""
+    timings = g.get(_TIMINGS_ATTR)
+    if timings is None:
+        yield
+        return
+
+    start = default_timer()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + default_timer() - start
@@ -10,68 +10,73 @@
 
 from datetime import datetime
 
-from flask import current_app
-
-from ..api import is_item_available
+from ..api import is_item_available, sync_active_loan, sync_loan_request
+from ..cache import call_callback
+from ..dispatch import send_loan_state_changed
 from ..errors import InvalidCirculationPermission, InvalidState, \
     ItemNotAvailable, TransitionConditionsFailed, \
     TransitionConstraintsViolation
-from ..signals import loan_state_changed
+from ..indexer import enqueue_loans_for_indexing
+from ..proxies import current_circulation
+from ..timing import timed
 from ..utils import parse_date
 
 
-def ensure_same_item_patron(f):
-    """Validate that item and patron PIDs exist and cannot be changed."""
-    def inner(self, loan, **kwargs):
-        new_patron_pid = kwargs.get('patron_pid')
-        new_item_pid = kwargs.get('item_pid')
-
-        if not current_app.config['CIRCULATION_ITEM_EXISTS'](new_item_pid):
-            msg = 'Item `{0}` not found in the system'.format(new_item_pid)
-            raise TransitionConstraintsViolation(msg=msg)
-
-        if loan.get('item_pid') and new_item_pid != loan['item_pid']:
-            msg = 'Loan item is `{0}` but transition is trying to set it to ' \
-                  '`{1}`'.format(loan['item_pid'], new_item_pid)
-            raise TransitionConstraintsViolation(msg=msg)
-
-        if not current_app.config['CIRCULATION_PATRON_EXISTS'](new_patron_pid):
-            msg = 'Patron `{0}` not found in the system'.format(new_patron_pid)
-            raise TransitionConstraintsViolation(msg=msg)
+def check_trigger(trigger):
+    """Build the validator of the trigger of a transition."""
+    msg = 'No param `trigger` with value `{0}`.'.format(trigger)
 
-        if 'patron_pid' in loan and new_patron_pid != loan['patron_pid']:
-            msg = 'Loan patron is `{0}` but transition is trying to set it ' \
-                  'to `{1}`'.format(loan['patron_pid'], new_patron_pid)
-            raise TransitionConstraintsViolation(msg=msg)
+    def validate(loan, kwargs):
+        if kwargs.get('trigger', 'next') != trigger:
+            raise TransitionConditionsFailed(msg=msg)
+    return validate
 
-        return f(self, loan, **kwargs)
-    return inner
 
+def ensure_required_params(required_params, partial_required_params):
+    """Build the validator of the parameters required by a transition."""
+    required_params = tuple(required_params)
+    partial_required_params = tuple(partial_required_params)
 
-def ensure_required_params(f):
-    """Decorator to ensure that all required parameters has been passed."""
-    def inner(self, loan, **kwargs):
-        missing = [p for p in self.REQUIRED_PARAMS if p not in kwargs]
+    def validate(loan, kwargs):
+        missing = [p for p in required_params if p not in kwargs]
         if missing:
             msg = 'Required input parameters are missing `[{}]`'\
                 .format(missing)
             raise TransitionConstraintsViolation(msg=msg)
-        if all(param not in kwargs for param in self.PARTIAL_REQUIRED_PARAMS):
+        if partial_required_params and \
+                all(p not in kwargs for p in partial_required_params):
             msg = 'One of the parameters `[{}]` must be passed.'\
-                .format(missing)
+                .format(list(partial_required_params))
             raise TransitionConstraintsViolation(msg=msg)
-        return f(self, loan, **kwargs)
-    return inner
+    return validate
 
 
-def check_trigger(f):
-    """Decorator to check the transition should be manually triggered."""
-    def inner(self, loan, **kwargs):
-        if kwargs.get('trigger', 'next') != self.trigger:
-            msg = 'No param `trigger` with value `{0}`.'.format(self.trigger)
-            raise TransitionConditionsFailed(msg=msg)
-        return f(self, loan, **kwargs)
-    return inner
+def ensure_same_item_patron(loan, kwargs):
+    """Validate that the item and patron of the loan are not changed."""
+    new_item_pid = kwargs.get('item_pid')
+    if loan.get('item_pid') and new_item_pid != loan['item_pid']:
+        msg = 'Loan item is `{0}` but transition is trying to set it to ' \
+              '`{1}`'.format(loan['item_pid'], new_item_pid)
+        raise TransitionConstraintsViolation(msg=msg)
+
+    new_patron_pid = kwargs.get('patron_pid')
+    if 'patron_pid' in loan and new_patron_pid != loan['patron_pid']:
+        msg = 'Loan patron is `{0}` but transition is trying to set it ' \
+              'to `{1}`'.format(loan['patron_pid'], new_patron_pid)
+        raise TransitionConstraintsViolation(msg=msg)
+
+
+def ensure_item_patron_exist(loan, kwargs):
+    """Validate that the item and patron PIDs exist."""
+    new_item_pid = kwargs.get('item_pid')
+    if not call_callback('CIRCULATION_ITEM_EXISTS', new_item_pid):
+        msg = 'Item `{0}` not found in the system'.format(new_item_pid)
+        raise TransitionConstraintsViolation(msg=msg)
+
+    new_patron_pid = kwargs.get('patron_pid')
+    if not call_callback('CIRCULATION_PATRON_EXISTS', new_patron_pid):
+        msg = 'Patron `{0}` not found in the system'.format(new_patron_pid)
+        raise TransitionConstraintsViolation(msg=msg)
 
 
 class Transition(object):
@@ -96,9 +101,25 @@ class Transition(object):
         self.dest = dest
         self.trigger = trigger
         self.permission_factory = permission_factory or \
-            current_app.config['CIRCULATION_PERMISSION_FACTORY']
+            current_circulation.settings['CIRCULATION_PERMISSION_FACTORY']
         # validate states
         self.validate_transition_states()
+        self.validators = self.build_validators()
+
+    def build_validators(self):
+        """Return the ordered checks of the input parameters.
+
+        The checks are built once per transition and run cheapest first: the
+        trigger, the parameters, then the callbacks checking that the item
+        and the patron exist.
+        """
+        return [
+            check_trigger(self.trigger),
+            ensure_required_params(self.REQUIRED_PARAMS,
+                                   self.PARTIAL_REQUIRED_PARAMS),
+            ensure_same_item_patron,
+            ensure_item_patron_exist,
+        ]
 
     def ensure_item_is_available(self, loan):
         """Validate that an item is available."""
@@ -110,17 +131,17 @@ class Transition(object):
 
     def validate_transition_states(self):
         """Ensure that source and destination states are valid."""
-        states = current_app.config['CIRCULATION_LOAN_TRANSITIONS'].keys()
-        if not all([self.src in states, self.dest in states]):
+        states = current_circulation.settings.states
+        if self.src not in states or self.dest not in states:
             msg = 'Source state `{0}` or destination state `{1}` not in [{2}]'\
                 .format(self.src, self.dest, states)
             raise InvalidState(msg=msg)
 
-    @ensure_same_item_patron
-    @ensure_required_params
-    @check_trigger
     def before(self, loan, **kwargs):
         """Validate input, evaluate conditions and raise if failed."""
+        for validate in self.validators:
+            validate(loan, kwargs)
+
         if self.permission_factory and not self.permission_factory(loan).can():
             msg = 'Invalid circulation permission'
             raise InvalidCirculationPermission(msg=msg)
@@ -131,13 +152,19 @@ class Transition(object):
 
     def execute(self, loan, **kwargs):
         """Execute before actions, transition and after actions."""
-        self.before(loan, **kwargs)
+        with timed('before'):
+            self.before(loan, **kwargs)
         loan['state'] = self.dest
-        self.after(loan)
+        with timed('after'):
+            self.after(loan)
 
     def after(self, loan):
         """Commit record and index."""
         loan['transaction_date'] = loan['transaction_date'].isoformat()
-        loan.commit()
-        # TODO: save to db and index loan here, then broadcast the changes.
-        loan_state_changed.send(self, loan=loan)
+        with timed('commit'):
+            sync_active_loan(loan)
+            sync_loan_request(loan)
+            loan.commit()
+        enqueue_loans_for_indexing([loan])
+        with timed('signal'):
+            send_loan_state_changed(self, loan)
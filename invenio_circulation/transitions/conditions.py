@@ -8,13 +8,13 @@
 
 """Invenio Circulation transitions conditions."""
 
-from flask import current_app
+from ..cache import call_callback
 
 
 def is_same_location(item_pid, input_location_pid):
     """Return True if item belonging location is same as input parameter."""
-    item_location_pid = current_app.config.get(
-        'CIRCULATION_ITEM_LOCATION_RETRIEVER'
-    )(item_pid)
+    item_location_pid = call_callback(
+        'CIRCULATION_ITEM_LOCATION_RETRIEVER', item_pid
+    )
 
     return input_location_pid == item_location_pid
@@ -10,12 +10,13 @@
 
 from datetime import datetime, timedelta
 
-from flask import current_app
-from invenio_db import db
-
 from ..api import get_available_item_by_doc_pid, get_document_by_item_pid, \
-    get_pending_loans_by_doc_pid, is_item_available
+    get_next_pending_loan_by_doc_pid, is_item_available, sync_active_loan, \
+    sync_loan_request
+from ..cache import call_callback
 from ..errors import TransitionConditionsFailed, TransitionConstraintsViolation
+from ..indexer import enqueue_loans_for_indexing
+from ..proxies import current_circulation
 from ..transitions.base import Transition
 from ..transitions.conditions import is_same_location
 from ..utils import parse_date
@@ -24,15 +25,14 @@ from ..utils import parse_date
 def _ensure_valid_loan_duration(loan):
     """Validate start and end dates for a loan."""
     loan.setdefault('start_date', loan['transaction_date'])
+    policies = current_circulation.settings.policies['checkout']
 
     if not loan.get('end_date'):
-        get_loan_duration = current_app.config['CIRCULATION_POLICIES'][
-            'checkout']['duration_default']
+        get_loan_duration = policies['duration_default']
         number_of_days = get_loan_duration(loan)
         loan['end_date'] = loan['start_date'] + timedelta(days=number_of_days)
 
-    is_duration_valid = current_app.config['CIRCULATION_POLICIES']['checkout'][
-        'duration_validate']
+    is_duration_valid = policies['duration_validate']
     if not is_duration_valid(loan):
         msg = 'The loan duration from `{0}` to `{1}` is not valid'.format(
             loan['start_date'],
@@ -50,19 +50,26 @@ def _ensure_item_attached_to_loan(loan):
 
 
 def _update_document_pending_request_for_item(item_pid):
-    """."""
+    """Attach the item to the next pending request on its document."""
     document_pid = get_document_by_item_pid(item_pid)
-    for loan in get_pending_loans_by_doc_pid(document_pid):
-        loan['item_pid'] = item_pid
-        loan.commit()
-        db.session.commit()
-        # TODO: index loan again?
+    if not document_pid:
+        return
+
+    loan = get_next_pending_loan_by_doc_pid(document_pid)
+    if loan is None:
+        return
+
+    loan['item_pid'] = item_pid
+    sync_active_loan(loan)
+    sync_loan_request(loan)
+    loan.commit()
+    enqueue_loans_for_indexing([loan])
 
 
 def _ensure_valid_extension(loan):
     """Validate end dates for a extended loan."""
-    get_extension_max_count = current_app.config['CIRCULATION_POLICIES'][
-        'extension']['max_count']
+    policies = current_circulation.settings.policies['extension']
+    get_extension_max_count = policies['max_count']
     extension_max_count = get_extension_max_count(loan)
 
     extension_count = loan.get('extension_count', 0)
@@ -73,11 +80,9 @@ def _ensure_valid_extension(loan):
 
     loan['extension_count'] = extension_count
 
-    get_extension_duration = current_app.config['CIRCULATION_POLICIES'][
-        'extension']['duration_default']
+    get_extension_duration = policies['duration_default']
     number_of_days = get_extension_duration(loan)
-    get_extension_from_end_date = current_app.config[
-        'CIRCULATION_POLICIES']['extension']['from_end_date']
+    get_extension_from_end_date = policies['from_end_date']
 
     end_date = parse_date(loan['end_date'])
     if not get_extension_from_end_date:
@@ -110,8 +115,8 @@ class CreatedToPending(Transition):
 
         # set pickup location to item location if not passed as default
         if not loan.get('pickup_location_pid'):
-            item_location_pid = current_app.config[
-                'CIRCULATION_ITEM_LOCATION_RETRIEVER'](loan['item_pid'])
+            item_location_pid = call_callback(
+                'CIRCULATION_ITEM_LOCATION_RETRIEVER', loan['item_pid'])
             loan['pickup_location_pid'] = item_location_pid
 
 
@@ -255,5 +260,5 @@ class ItemInTransitHouseToItemReturned(Transition):
 
     def after(self, loan):
         """Convert dates to string before saving loan."""
-        super(ItemOnLoanToItemReturned, self).after(loan)
+        super(ItemInTransitHouseToItemReturned, self).after(loan)
         _update_document_pending_request_for_item(loan['item_pid'])
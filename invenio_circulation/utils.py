@@ -12,6 +12,8 @@ from datetime import timedelta
 
 import ciso8601
 
+from .policies import get_loan_policy
+
 
 def patron_exists(patron_pid):
     """Return True if patron exists, False otherwise."""
@@ -33,25 +35,41 @@ def item_location_retriever(item_pid):
     return ''
 
 
+def patron_category_retriever(patron_pid):
+    """Retrieve the category of the passed patron pid."""
+    return None
+
+
+def item_category_retriever(item_pid):
+    """Retrieve the category of the passed item pid."""
+    return None
+
+
 def get_default_loan_duration(loan):
     """Return a default loan duration in number of days."""
-    return 30
+    return get_loan_policy(loan, 'checkout_duration', 30)
 
 
 def get_default_extension_duration(loan):
     """Return a default extension duration in number of days."""
-    return 30
+    return get_loan_policy(loan, 'extension_duration', 30)
 
 
 def get_default_extension_max_count(loan):
     """Return a default extensions max count."""
-    return float("inf")
+    return get_loan_policy(loan, 'extension_max_count', float("inf"))
+
+
+def get_default_request_priority(loan):
+    """Return a default priority of a request, lower is served first."""
+    return get_loan_policy(loan, 'request_priority', 0)
 
 
 def is_loan_duration_valid(loan):
     """Validate the loan duration."""
+    max_days = get_loan_policy(loan, 'checkout_duration_max', 60)
     return loan['end_date'] > loan['start_date'] and \
-        loan['end_date'] - loan['start_date'] < timedelta(days=60)
+        loan['end_date'] - loan['start_date'] < timedelta(days=max_days)
 
 
 def parse_date(str_date):
@@ -8,23 +8,42 @@
 
 """Circulation views."""
 
+import json
 from copy import deepcopy
 
-from flask import Blueprint, current_app, request, url_for
+from flask import Blueprint, Response, abort, current_app, request, \
+    stream_with_context, url_for
+from flask.views import MethodView
 from invenio_db import db
+from invenio_pidstore.errors import PersistentIdentifierError
 from invenio_records_rest.utils import obj_or_import_string
 from invenio_records_rest.views import \
     create_error_handlers as records_rest_error_handlers
 from invenio_records_rest.views import pass_record
 from invenio_rest import ContentNegotiatedMethodView
 from invenio_rest.views import create_api_errorhandler
+from jsonschema.exceptions import ValidationError
+from sqlalchemy.exc import IntegrityError
 
-from invenio_circulation.errors import InvalidCirculationPermission, \
-    ItemNotAvailable, LoanActionError, NoValidTransitionAvailable
+from invenio_circulation.api import Loan
+from invenio_circulation.cache import callbacks_cache
+from invenio_circulation.errors import BulkLoanActionsError, \
+    CirculationException, IdempotencyKeyConflictError, IdempotencyKeyError, \
+    InvalidCirculationPermission, InvalidExportFormatError, ItemNotAvailable, \
+    LoanActionError, LoanConflictError, NoValidTransitionAvailable
+from invenio_circulation.export import EXPORT_FORMATS, EXPORT_MIMETYPES, \
+    export_loans
+from invenio_circulation.idempotency import IDEMPOTENCY_KEY_HEADER, \
+    claim_idempotency_key, store_response
 from invenio_circulation.proxies import current_circulation
 
 HTTP_CODES = {
+    'ok': 200,
+    'bad_request': 400,
+    'not_found': 404,
     'method_not_allowed': 405,
+    'conflict': 409,
+    'unprocessable_entity': 422,
     'accepted': 202
 }
 
@@ -34,6 +53,24 @@ def create_error_handlers(blueprint):
     blueprint.errorhandler(LoanActionError)(create_api_errorhandler(
         status=HTTP_CODES['method_not_allowed'], message='Invalid loan action'
     ))
+    blueprint.errorhandler(BulkLoanActionsError)(create_api_errorhandler(
+        status=HTTP_CODES['bad_request'], message='Invalid bulk loan actions'
+    ))
+    blueprint.errorhandler(LoanConflictError)(create_api_errorhandler(
+        status=HTTP_CODES['conflict'],
+        message='Loan changed concurrently, retry the action'
+    ))
+    blueprint.errorhandler(IdempotencyKeyError)(create_api_errorhandler(
+        status=HTTP_CODES['unprocessable_entity'],
+        message='Idempotency key already used for another request'
+    ))
+    blueprint.errorhandler(IdempotencyKeyConflictError)(
+        create_api_errorhandler(
+            status=HTTP_CODES['conflict'],
+            message='Idempotency key used by a request in progress, retry '
+                    'the action later'
+        )
+    )
     records_rest_error_handlers(blueprint)
 
 
@@ -47,13 +84,13 @@ def extract_transitions_from_app(app):
     return distinct_actions
 
 
-def build_url_action_for_pid(pid, action):
+def build_url_action_for_pid(pid, action, external=True):
     """."""
     return url_for(
         'invenio_circulation.{0}_actions'.format(pid.pid_type),
         pid_value=pid.pid_value,
         action=action,
-        _external=True
+        _external=external
     )
 
 
@@ -97,9 +134,39 @@ def build_blueprint_with_loan_actions(app):
             methods=['POST'],
         )
 
+        bulk_actions = LoanBulkActionResource.as_view(
+            LoanBulkActionResource.view_name.format(pid_type),
+            serializers={'application/json': bulk_actions_json_response},
+            ctx=dict(actions=distinct_actions),
+        )
+        blueprint.add_url_rule(
+            '{0}actions'.format(options['list_route']),
+            view_func=bulk_actions,
+            methods=['POST'],
+        )
+
+        blueprint.add_url_rule(
+            '{0}export'.format(options['list_route']),
+            view_func=LoansExportResource.as_view(
+                LoansExportResource.view_name.format(pid_type)
+            ),
+            methods=['GET'],
+        )
+
     return blueprint
 
 
+def bulk_actions_json_response(results, code, headers=None):
+    """Serialize the outcomes of a bulk loan actions request."""
+    response = current_app.response_class(
+        json.dumps(results), mimetype='application/json'
+    )
+    response.status_code = code
+    if headers is not None:
+        response.headers.extend(headers)
+    return response
+
+
 class LoanActionResource(ContentNegotiatedMethodView):
     """Loan action resource."""
 
@@ -117,14 +184,29 @@ class LoanActionResource(ContentNegotiatedMethodView):
 
     @pass_record
     def post(self, pid, record, action, **kwargs):
-        """Handle loan action."""
+        """Handle loan action.
+
+        An ``If-Match`` header with the revision of the loan the action was
+        decided on makes the action fail if the loan was changed since.
+
+        With an ``Idempotency-Key`` header, the key is claimed before the
+        action, the response of a successful action is stored with the loan
+        changes, and the retries with the same key get it back without
+        performing the action again.
+        """
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if key:
+            stored = claim_idempotency_key(key)
+            if stored is not None:
+                return stored
+
+        self.check_etag(str(record.revision_id))
         params = request.get_json()
         try:
             # perform action on the current loan
             record = current_circulation.circulation.trigger(
                 record, **dict(params, trigger=action)
             )
-            db.session.commit()
         except (
             ItemNotAvailable,
             InvalidCirculationPermission,
@@ -133,7 +215,136 @@ class LoanActionResource(ContentNegotiatedMethodView):
             current_app.logger.exception(ex.msg)
             raise LoanActionError(ex)
 
-        return self.make_response(
+        response = self.make_response(
             pid, record, HTTP_CODES['accepted'],
             links_factory=self.links_factory
         )
+        if key:
+            store_response(key, response)
+        db.session.commit()
+        return response
+
+
+class LoanBulkActionResource(ContentNegotiatedMethodView):
+    """Resource performing a batch of loan actions in one transaction."""
+
+    view_name = '{0}_bulk_actions'
+
+    def __init__(self, serializers, ctx, *args, **kwargs):
+        """Constructor."""
+        super(LoanBulkActionResource, self).__init__(
+            serializers,
+            *args,
+            **kwargs
+        )
+        for key, value in ctx.items():
+            setattr(self, key, value)
+
+    def _validate(self, actions):
+        """Validate the payload of the request."""
+        if not isinstance(actions, list):
+            raise BulkLoanActionsError(msg='A list of actions is expected.')
+        max_size = current_circulation.settings[
+            'CIRCULATION_BULK_ACTIONS_MAX_SIZE'
+        ]
+        if len(actions) > max_size:
+            raise BulkLoanActionsError(
+                msg='Too many actions, at most {0} are allowed.'
+                    .format(max_size)
+            )
+        for entry in actions:
+            if not isinstance(entry, dict) or \
+                    entry.get('action') not in self.actions or \
+                    not isinstance(entry.get('params', {}), dict):
+                raise BulkLoanActionsError(
+                    msg='Invalid action `{0}`.'.format(entry)
+                )
+
+    def _perform(self, entry):
+        """Perform one loan action inside its own savepoint."""
+        result = dict(pid=entry.get('pid'), action=entry['action'])
+        params = entry.get('params', {})
+        try:
+            with db.session.begin_nested():
+                loan = Loan.get_record_by_pid(entry.get('pid'))
+                current_circulation.circulation.trigger(
+                    loan, **dict(params, trigger=entry['action'])
+                )
+        except PersistentIdentifierError:
+            result.update(status=HTTP_CODES['not_found'],
+                          message='Loan not found.')
+            return result
+        except LoanConflictError as ex:
+            current_app.logger.debug(ex.msg)
+            result.update(status=HTTP_CODES['conflict'], message=ex.msg)
+            return result
+        except CirculationException as ex:
+            current_app.logger.debug(ex.msg)
+            result.update(status=HTTP_CODES['method_not_allowed'],
+                          message=ex.msg)
+            return result
+        except ValidationError as ex:
+            current_app.logger.debug(ex.message)
+            result.update(status=HTTP_CODES['bad_request'],
+                          message='Invalid loan: {0}'.format(ex.message))
+            return result
+        except IntegrityError:
+            current_app.logger.exception('Loan action failed.')
+            result.update(status=HTTP_CODES['conflict'],
+                          message='Loan action conflicts with another.')
+            return result
+
+        result.update(status=HTTP_CODES['accepted'], metadata=loan.dumps())
+        return result
+
+    def post(self, **kwargs):
+        """Handle a batch of loan actions.
+
+        Each action is performed in a savepoint, rolled back when the action
+        fails, so that a failing action does not prevent the others to be
+        committed. The touched loans are bulk
+        indexed at the end of the request. The outcome of each action is
+        returned in the same order as the request.
+        """
+        actions = request.get_json()
+        self._validate(actions)
+
+        results = []
+        with callbacks_cache():
+            for entry in actions:
+                results.append(self._perform(entry))
+        db.session.commit()
+
+        return self.make_response(results, HTTP_CODES['ok'])
+
+
+class LoansExportResource(MethodView):
+    """Resource streaming an export of the loans."""
+
+    view_name = '{0}_export'
+
+    def get(self, **kwargs):
+        """Stream the loans as NDJSON or CSV.
+
+        The ``format`` query argument selects the format, ``fields`` the
+        comma separated loan fields and ``state`` the loan states to export.
+        """
+        permission_factory = current_circulation.settings[
+            'CIRCULATION_LOANS_EXPORT_PERMISSION_FACTORY'
+        ]
+        if not permission_factory(record=None).can():
+            abort(403)
+
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            raise InvalidExportFormatError(fmt, EXPORT_FORMATS)
+        fields = [field for field in request.args.get('fields', '').split(',')
+                  if field]
+        states = request.args.getlist('state')
+
+        return Response(
+            stream_with_context(
+                export_loans(fmt=fmt, fields=fields, states=states)
+            ),
+            mimetype=EXPORT_MIMETYPES[fmt],
+        )
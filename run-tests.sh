@@ -7,6 +7,11 @@
 # Invenio-Circulation is free software; you can redistribute it and/or modify it
 # under the terms of the MIT License; see LICENSE file for more details.
 
+# ./run-tests.sh benchmarks: only run the benchmarks, skipped otherwise.
+if [ "$1" = "benchmarks" ]; then
+    exec python -m pytest tests/test_benchmarks.py --benchmark-only
+fi
+
 pydocstyle invenio_circulation tests docs && \
 isort -rc -c -df && \
 check-manifest --ignore ".travis-*" && \
@@ -22,6 +22,7 @@ tests_require = [
     'invenio-jsonschemas>=1.0.0',
     'mock>=1.3.0',
     'pydocstyle>=1.0.0',
+    'pytest-benchmark>=3.1.0',
     'pytest-cache>=1.0',
     'pytest-cov>=1.8.0',
     'pytest-pep8>=1.0.6',
@@ -76,6 +77,7 @@ install_requires = [
     'ciso8601>=2.0.1',
     'Flask-BabelEx>=0.9.3',
     'invenio-base>=1.0.1',
+    'invenio-indexer>=1.0.0',
     'invenio-logging>=1.0.0',
     'invenio-pidstore>=1.0.0',
     'invenio-records>=1.0.0',
@@ -112,6 +114,18 @@ setup(
         'invenio_base.apps': [
             'invenio_circulation = invenio_circulation:InvenioCirculation'
         ],
+        'flask.commands': [
+            'circulation = invenio_circulation.cli:circulation',
+        ],
+        'invenio_celery.tasks': [
+            'invenio_circulation = invenio_circulation.tasks',
+        ],
+        'invenio_db.alembic': [
+            'invenio_circulation = invenio_circulation:alembic',
+        ],
+        'invenio_db.models': [
+            'invenio_circulation = invenio_circulation.models',
+        ],
         'invenio_i18n.translations': ['messages = invenio_circulation'],
         'invenio_pidstore.fetchers': [
             'loanid = invenio_circulation.pid.fetchers:loan_pid_fetcher'
@@ -41,6 +41,7 @@ def app_config(app_config):
     app_config['RECORDS_REST_DEFAULT_READ_PERMISSION_FACTORY'] = None
     app_config['CIRCULATION_ITEM_EXISTS'] = lambda x: True
     app_config['CIRCULATION_PATRON_EXISTS'] = lambda x: True
+    app_config['CIRCULATION_LOANS_BULK_INDEXING'] = False
     app_config['CIRCULATION_REST_PERMISSION_FACTORIES'] = dict(
         loanid=dict(create_permission_factory_imp=allow_all)
     )
@@ -18,6 +18,7 @@ from invenio_pidstore import current_pidstore
 from six.moves import reduce
 
 from invenio_circulation.api import Loan
+from invenio_circulation.proxies import current_circulation
 
 
 class SwappedConfig:
@@ -32,10 +33,12 @@ class SwappedConfig:
         """Save previous value and swap it with the new."""
         self.prev_value = current_app.config[self.key]
         current_app.config[self.key] = self.new_value
+        current_circulation.reload()
 
     def __exit__(self, type, value, traceback):
         """Restore previous value."""
         current_app.config[self.key] = self.prev_value
+        current_circulation.reload()
 
 
 class SwappedNestedConfig:
@@ -52,12 +55,14 @@ class SwappedNestedConfig:
                             current_app.config)
         self.prev_value = config_obj[self.nested_keys[-1]]
         config_obj[self.nested_keys[-1]] = self.new_value
+        current_circulation.reload()
 
     def __exit__(self, type, value, traceback):
         """Restore previous value."""
         config_obj = reduce(dict.__getitem__, self.nested_keys[:-1],
                             current_app.config)
         config_obj[self.nested_keys[-1]] = self.prev_value
+        current_circulation.reload()
 
 
 def create_loan(data):
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the database backed items availability."""
+
+import pytest
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from helpers import SwappedConfig
+
+from invenio_circulation.api import Loan, are_items_available, \
+    is_item_available
+from invenio_circulation.cli import circulation
+from invenio_circulation.errors import ItemNotAvailable
+from invenio_circulation.models import ActiveLoan
+from invenio_circulation.pid.minters import loan_pid_minter
+from invenio_circulation.proxies import current_circulation
+
+
+@pytest.yield_fixture()
+def availability_from_db(app):
+    """Check the items availability in the database."""
+    with SwappedConfig('CIRCULATION_ITEM_AVAILABILITY_FROM_DB', True):
+        yield
+
+
+def test_active_loans_follow_transitions(availability_from_db, loan_created,
+                                         db, params):
+    """Test that the active loans table is maintained by the transitions."""
+    assert is_item_available('item_pid')
+
+    loan = current_circulation.circulation.trigger(
+        loan_created, **dict(params, trigger='checkout')
+    )
+    db.session.commit()
+    row = ActiveLoan.query.get(loan.id)
+    assert row.item_pid == 'item_pid'
+    assert row.state == 'ITEM_ON_LOAN'
+    assert row.active_item_pid == 'item_pid'
+    assert not is_item_available('item_pid')
+    assert are_items_available(['item_pid', 'other_item_pid']) == {
+        'item_pid': False,
+        'other_item_pid': True,
+    }
+
+    with pytest.raises(ItemNotAvailable):
+        current_circulation.circulation.trigger(
+            Loan.create({}), **dict(params, trigger='checkout')
+        )
+
+    same_location = params['transaction_location_pid']
+    with SwappedConfig('CIRCULATION_ITEM_LOCATION_RETRIEVER',
+                       lambda x: same_location):
+        loan = current_circulation.circulation.trigger(loan, **dict(params))
+    db.session.commit()
+    assert loan['state'] == 'ITEM_RETURNED'
+    assert ActiveLoan.query.get(loan.id) is None
+    assert is_item_available('item_pid')
+
+
+def test_item_held_by_one_loan(loan_created, db, params,
+                               mock_is_item_available):
+    """Test that two loans cannot hold the same item.
+
+    The active loans are maintained even when the availability is checked in
+    the loans index.
+    """
+    current_circulation.circulation.trigger(
+        loan_created, **dict(params, trigger='checkout')
+    )
+    db.session.commit()
+
+    # availability check bypassed, as with a concurrent transaction
+    with pytest.raises(ItemNotAvailable):
+        current_circulation.circulation.trigger(
+            Loan.create({}), **dict(params, trigger='checkout')
+        )
+
+
+def test_pending_loans_do_not_hold_item(availability_from_db, loan_created,
+                                        db, params):
+    """Test that several requests can be pending on the same item."""
+    for loan in [loan_created, Loan.create({})]:
+        loan = current_circulation.circulation.trigger(
+            loan, **dict(params,
+                         trigger='request',
+                         pickup_location_pid='pickup_location_pid')
+        )
+        assert loan['state'] == 'PENDING'
+        assert ActiveLoan.query.get(loan.id).active_item_pid is None
+    db.session.commit()
+    assert not is_item_available('item_pid')
+
+
+def test_rebuild_active_loans(base_app, loan_created, db, params,
+                              mock_is_item_available):
+    """Test the rebuild of the active loans table from the loans."""
+    loan_pid_minter(loan_created.id, loan_created)
+    loan = current_circulation.circulation.trigger(
+        loan_created, **dict(params, trigger='checkout')
+    )
+    db.session.commit()
+    loan_id = loan.id
+    ActiveLoan.query.delete()
+    db.session.commit()
+
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: base_app)
+    result = runner.invoke(circulation, ['rebuild-active-loans'],
+                           obj=script_info)
+    assert result.exit_code == 0
+    assert ActiveLoan.query.get(loan_id).active_item_pid == 'item_pid'
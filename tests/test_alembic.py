@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the circulation database migrations."""
+
+
+def test_alembic_branch(app):
+    """Test that the circulation migrations form a single branch."""
+    alembic = app.extensions['invenio-db'].alembic
+    script = alembic.script_directory
+    revision = script.get_revision('invenio_circulation@head')
+    while revision.down_revision:
+        revision = script.get_revision(revision.down_revision)
+    assert revision.revision == '3fb957c358fe'
+    assert 'invenio_circulation' in revision.branch_labels
@@ -10,9 +10,13 @@
 
 import json
 
+import mock
 from flask import url_for
+from helpers import SwappedConfig
 
 from invenio_circulation.api import Loan
+from invenio_circulation.errors import LoanConflictError
+from invenio_circulation.links import loan_links_factory
 from invenio_circulation.pid.fetchers import loan_pid_fetcher
 from invenio_circulation.pid.minters import loan_pid_minter
 from invenio_circulation.proxies import current_circulation
@@ -71,6 +75,7 @@ def test_api_automatic_loan_valid_action(app, db, json_headers, params):
     app.config[
         'CIRCULATION_ITEM_LOCATION_RETRIEVER'
     ] = lambda x: 'pickup_location_pid'
+    current_circulation.reload()
 
     loan_pid = loan_pid_fetcher(loan.id, loan)
     assert minted_loan.pid_value == loan_pid.pid_value
@@ -111,6 +116,33 @@ def test_api_loan_invalid_action(app, db, json_headers, params,
         assert 'message' in error_dict
 
 
+def test_api_loan_action_concurrency(app, db, json_headers, params,
+                                     mock_is_item_available):
+    """Test API action on a loan changed concurrently."""
+    loan = Loan.create({})
+    pid = loan_pid_minter(loan.id, loan)
+    db.session.commit()
+
+    with app.test_client() as client:
+        url = url_for('invenio_circulation.loanid_actions',
+                      pid_value=pid.pid_value, action='checkout')
+        headers = json_headers + [('If-Match', '"{0}"'.format(
+            loan.revision_id + 1))]
+        res = client.post(url, headers=headers, data=json.dumps(params))
+        assert res.status_code == 412
+
+        with mock.patch('invenio_circulation.ext.lock_loan',
+                        side_effect=LoanConflictError(msg='changed')):
+            res = client.post(url, headers=json_headers,
+                              data=json.dumps(params))
+        assert res.status_code == HTTP_CODES['conflict']
+
+        headers = json_headers + [('If-Match', '"{0}"'.format(
+            loan.revision_id))]
+        res = client.post(url, headers=headers, data=json.dumps(params))
+        assert res.status_code == HTTP_CODES['accepted']
+
+
 def test_api_loans_links_factory(app, db, json_headers, params,
                                  mock_is_item_available):
     """Test API GET call to fetch a loan by PID."""
@@ -132,3 +164,154 @@ def test_api_loans_links_factory(app, db, json_headers, params,
         assert res.status_code == 200
         loan_dict = json.loads(res.data.decode('utf-8'))
         assert loan_dict['links'] == expected_links
+
+
+def test_loans_links_factory_from_search_hit(app, db):
+    """Test links generation from a search hit without database query."""
+    loan = Loan.create({})
+    minted_loan = loan_pid_minter(loan.id, loan)
+    db.session.commit()
+
+    record_hit = {'_source': {'state': 'PENDING'}}
+    with mock.patch.object(Loan, 'get_record') as mock_get_record:
+        links = loan_links_factory(minted_loan, record_hit=record_hit)
+        assert not mock_get_record.called
+    assert links == {
+        'available_actions': {
+            action: build_url_action_for_pid(minted_loan, action)
+            for action in ['next', 'cancel']
+        }
+    }
+    assert loan_links_factory(minted_loan, record=dict(
+        state='ITEM_RETURNED')) == {'available_actions': {}}
+
+
+def test_loans_links_factory_hosts(base_app, db):
+    """Test that the links follow the host while their paths are cached."""
+    loan = Loan.create({})
+    minted_loan = loan_pid_minter(loan.id, loan)
+    db.session.commit()
+
+    with SwappedConfig('SERVER_NAME', None):
+        for host_url in ['http://localhost', 'https://other.example.org']:
+            with base_app.test_request_context(base_url=host_url):
+                path = build_url_action_for_pid(minted_loan, 'next',
+                                                external=False)
+                links = loan_links_factory(minted_loan,
+                                           record=dict(state='PENDING'))
+                assert links['available_actions']['next'] == host_url + path
+        assert list(current_circulation.url_templates) == [
+            ('loanid', 'PENDING')
+        ]
+
+
+@mock.patch('invenio_circulation.indexer.RecordIndexer')
+def test_api_bulk_loan_actions(mock_indexer, app, db, json_headers, params,
+                               mock_is_item_available):
+    """Test API bulk actions on several loans."""
+    loans = []
+    for _ in range(2):
+        loan = Loan.create({})
+        loan_pid_minter(loan.id, loan)
+        loans.append(loan)
+    db.session.commit()
+
+    actions = [
+        dict(pid=loans[0]['loanid'], action='checkout', params=params),
+        dict(pid=loans[1]['loanid'], action='cancel', params=params),
+        dict(pid='unknown', action='checkout', params=params),
+    ]
+    with SwappedConfig('CIRCULATION_LOANS_BULK_INDEXING', True):
+        with app.test_client() as client:
+            url = url_for('invenio_circulation.loanid_bulk_actions')
+            res = client.post(url, headers=json_headers,
+                              data=json.dumps(actions))
+            assert res.status_code == HTTP_CODES['ok']
+            results = json.loads(res.data.decode('utf-8'))
+
+    assert [r['status'] for r in results] == [
+        HTTP_CODES['accepted'],
+        HTTP_CODES['method_not_allowed'],
+        HTTP_CODES['not_found'],
+    ]
+    assert results[0]['metadata']['state'] == 'ITEM_ON_LOAN'
+    assert 'message' in results[1]
+    assert Loan.get_record(loans[0].id)['state'] == 'ITEM_ON_LOAN'
+    assert Loan.get_record(loans[1].id)['state'] == 'CREATED'
+    mock_indexer.return_value.bulk_index.assert_called_once_with(
+        [str(loans[0].id)]
+    )
+
+
+def test_api_bulk_loan_actions_invalid_loan(app, db, json_headers, params,
+                                            mock_is_item_available):
+    """Test API bulk actions with a loan failing the schema validation."""
+    loans = []
+    for _ in range(2):
+        loan = Loan.create({})
+        loan_pid_minter(loan.id, loan)
+        loans.append(loan)
+    db.session.commit()
+
+    actions = [
+        dict(pid=loans[0]['loanid'], action='request',
+             params=dict(params, pickup_location_pid=1)),
+        dict(pid=loans[1]['loanid'], action='checkout', params=params),
+    ]
+    with app.test_client() as client:
+        url = url_for('invenio_circulation.loanid_bulk_actions')
+        res = client.post(url, headers=json_headers, data=json.dumps(actions))
+        assert res.status_code == HTTP_CODES['ok']
+        results = json.loads(res.data.decode('utf-8'))
+
+    assert [r['status'] for r in results] == [
+        HTTP_CODES['bad_request'],
+        HTTP_CODES['accepted'],
+    ]
+    assert 'message' in results[0]
+    assert Loan.get_record(loans[0].id)['state'] == 'CREATED'
+    assert Loan.get_record(loans[1].id)['state'] == 'ITEM_ON_LOAN'
+
+
+@mock.patch('invenio_circulation.indexer.RecordIndexer')
+def test_api_bulk_checkin_with_queued_request(mock_indexer, app, db,
+                                              json_headers, params,
+                                              mock_is_item_available):
+    """Test API bulk checkin serving a request on the item document."""
+    loan = Loan.create({})
+    loan_pid_minter(loan.id, loan)
+    current_circulation.circulation.trigger(
+        loan, **dict(params, trigger='checkout')
+    )
+    queued = Loan.create(dict(state='PENDING', document_pid='document_pid',
+                              patron_pid='other_patron_pid'))
+    db.session.commit()
+
+    actions = [dict(pid=loan['loanid'], action='next', params=params)]
+    transitions = 'invenio_circulation.transitions.transitions'
+    with SwappedConfig('CIRCULATION_ITEM_LOCATION_RETRIEVER',
+                       lambda x: params['transaction_location_pid']), \
+            mock.patch(transitions + '.get_document_by_item_pid',
+                       return_value='document_pid'), \
+            mock.patch(transitions + '.get_next_pending_loan_by_doc_pid',
+                       return_value=queued):
+        with app.test_client() as client:
+            url = url_for('invenio_circulation.loanid_bulk_actions')
+            res = client.post(url, headers=json_headers,
+                              data=json.dumps(actions))
+            assert res.status_code == HTTP_CODES['ok']
+            results = json.loads(res.data.decode('utf-8'))
+
+    assert results[0]['status'] == HTTP_CODES['accepted']
+    assert results[0]['metadata']['state'] == 'ITEM_RETURNED'
+    assert Loan.get_record(queued.id)['item_pid'] == params['item_pid']
+
+
+def test_api_bulk_loan_actions_invalid_payload(app, db, json_headers):
+    """Test API bulk actions with an invalid payload."""
+    with app.test_client() as client:
+        url = url_for('invenio_circulation.loanid_bulk_actions')
+        for payload in [{}, [dict(pid='1', action='unknown')]]:
+            res = client.post(url, headers=json_headers,
+                              data=json.dumps(payload))
+            assert res.status_code == HTTP_CODES['bad_request']
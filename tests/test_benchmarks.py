@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Benchmarks of the circulation hot paths.
+
+The search engine is replaced by local stand-ins, so that only the
+circulation code and the database are measured. The benchmarks are skipped
+by the default test run, use ``./run-tests.sh benchmarks`` to run them.
+"""
+
+from itertools import count
+
+import mock
+import pytest
+from helpers import SwappedConfig
+
+from invenio_circulation.api import Loan, get_available_item_by_doc_pid, \
+    is_item_available
+from invenio_circulation.links import loan_links_factory
+from invenio_circulation.pid.minters import loan_pid_minter
+from invenio_circulation.proxies import current_circulation
+from invenio_circulation.search import LoansSearch
+
+pytestmark = pytest.mark.benchmark
+
+ROUNDS = 50
+
+
+@pytest.yield_fixture()
+def search_stand_in():
+    """Answer the loans search queries without search engine."""
+    with mock.patch.object(LoansSearch, 'has_loans_by_pid',
+                           return_value=False), \
+            mock.patch.object(LoansSearch, 'get_item_pids_with_loans',
+                              return_value=set()) as mock_item_pids:
+        yield mock_item_pids
+
+
+@pytest.yield_fixture()
+def same_location(app, params):
+    """Return the items at the transaction location."""
+    location_pid = params['transaction_location_pid']
+    with SwappedConfig('CIRCULATION_ITEM_LOCATION_RETRIEVER',
+                       lambda x: location_pid), \
+            SwappedConfig('CIRCULATION_DOCUMENT_RETRIEVER_FROM_ITEM',
+                          lambda x: 'document_pid'):
+        yield
+
+
+_item_counter = count()
+
+
+def _new_item_params(params):
+    """Return the parameters of an action on a new item.
+
+    An item can be held by a single loan, so each round uses its own.
+    """
+    return dict(params, item_pid='item_{0}'.format(next(_item_counter)))
+
+
+def _checked_out_loan(params):
+    """Create a loan on loan."""
+    return current_circulation.circulation.trigger(
+        Loan.create({}), **dict(params, trigger='checkout')
+    )
+
+
+def test_benchmark_checkout(benchmark, db, params, search_stand_in):
+    """Benchmark the checkout of a new loan."""
+    def setup():
+        return (Loan.create({}), ), dict(_new_item_params(params),
+                                         trigger='checkout')
+
+    loan = benchmark.pedantic(current_circulation.circulation.trigger,
+                              setup=setup, rounds=ROUNDS)
+    assert loan['state'] == 'ITEM_ON_LOAN'
+
+
+def test_benchmark_request(benchmark, db, params, search_stand_in):
+    """Benchmark the request of an item."""
+    def setup():
+        return (Loan.create({}), ), dict(
+            params, trigger='request', pickup_location_pid='pickup_pid'
+        )
+
+    loan = benchmark.pedantic(current_circulation.circulation.trigger,
+                              setup=setup, rounds=ROUNDS)
+    assert loan['state'] == 'PENDING'
+
+
+def test_benchmark_extend(benchmark, db, params, search_stand_in):
+    """Benchmark the extension of a loan."""
+    def setup():
+        item_params = _new_item_params(params)
+        return (_checked_out_loan(item_params), ), dict(item_params,
+                                                        trigger='extend')
+
+    loan = benchmark.pedantic(current_circulation.circulation.trigger,
+                              setup=setup, rounds=ROUNDS)
+    assert loan['extension_count'] == 1
+
+
+def test_benchmark_checkin(benchmark, db, params, search_stand_in,
+                           same_location):
+    """Benchmark the return of an item to its location."""
+    def setup():
+        item_params = _new_item_params(params)
+        return (_checked_out_loan(item_params), ), item_params
+
+    loan = benchmark.pedantic(current_circulation.circulation.trigger,
+                              setup=setup, rounds=ROUNDS)
+    assert loan['state'] == 'ITEM_RETURNED'
+
+
+def test_benchmark_is_item_available(benchmark, app, search_stand_in):
+    """Benchmark the availability check of an item."""
+    assert benchmark(is_item_available, 'item_pid')
+
+
+@pytest.mark.parametrize('items_count', [10, 100, 1000])
+def test_benchmark_get_available_item_by_doc_pid(benchmark, app,
+                                                 search_stand_in,
+                                                 items_count):
+    """Benchmark the lookup of an available item among many."""
+    item_pids = ['item_{0}'.format(i) for i in range(items_count)]
+    # only the last item is available
+    search_stand_in.return_value = set(item_pids[:-1])
+    with SwappedConfig('CIRCULATION_ITEMS_RETRIEVER_FROM_DOCUMENT',
+                       lambda x: item_pids):
+        item_pid = benchmark(get_available_item_by_doc_pid, 'document_pid')
+    assert item_pid == item_pids[-1]
+
+
+def test_benchmark_loan_links_factory(benchmark, app, db):
+    """Benchmark the links of a loan."""
+    loan = Loan.create({})
+    pid = loan_pid_minter(loan.id, loan)
+    db.session.commit()
+
+    links = benchmark(loan_links_factory, pid, record=loan)
+    assert set(links['available_actions']) == set(['request', 'checkout'])
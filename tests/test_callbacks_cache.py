@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the callbacks cache."""
+
+from helpers import SwappedConfig
+
+from invenio_circulation.cache import call_callback, callbacks_cache
+from invenio_circulation.proxies import current_circulation
+
+
+def test_callbacks_cache_memoize_calls(app):
+    """Test that each distinct call is performed once inside the block."""
+    calls = []
+
+    def retriever(item_pid):
+        calls.append(item_pid)
+        return 'loc_pid'
+
+    with SwappedConfig('CIRCULATION_ITEM_LOCATION_RETRIEVER', retriever):
+        with callbacks_cache():
+            for _ in range(3):
+                call_callback('CIRCULATION_ITEM_LOCATION_RETRIEVER', 'item1')
+            call_callback('CIRCULATION_ITEM_LOCATION_RETRIEVER', 'item2')
+            # nested blocks share the same cache
+            with callbacks_cache():
+                call_callback('CIRCULATION_ITEM_LOCATION_RETRIEVER', 'item1')
+        assert calls == ['item1', 'item2']
+
+        # no cache outside of the block
+        call_callback('CIRCULATION_ITEM_LOCATION_RETRIEVER', 'item1')
+        assert calls == ['item1', 'item2', 'item1']
+
+
+def test_callbacks_cache_disabled(app):
+    """Test that callbacks are always called when the cache is disabled."""
+    calls = []
+
+    def retriever(item_pid):
+        calls.append(item_pid)
+        return 'loc_pid'
+
+    with SwappedConfig('CIRCULATION_ITEM_LOCATION_RETRIEVER', retriever):
+        with SwappedConfig('CIRCULATION_CALLBACKS_CACHE', None):
+            with callbacks_cache():
+                call_callback('CIRCULATION_ITEM_LOCATION_RETRIEVER', 'item1')
+                call_callback('CIRCULATION_ITEM_LOCATION_RETRIEVER', 'item1')
+    assert calls == ['item1', 'item1']
+
+
+def test_trigger_retrieves_location_once(loan_created, db, params):
+    """Test that candidate transitions share the location lookups."""
+    loan = current_circulation.circulation.trigger(
+        loan_created, **dict(params,
+                             trigger='request',
+                             pickup_location_pid='pickup_location_pid')
+    )
+    db.session.commit()
+    assert loan['state'] == 'PENDING'
+
+    calls = []
+
+    def retriever(item_pid):
+        calls.append(item_pid)
+        return 'external_location_pid'
+
+    with SwappedConfig('CIRCULATION_ITEM_LOCATION_RETRIEVER', retriever):
+        loan = current_circulation.circulation.trigger(loan, **dict(params))
+    assert loan['state'] == 'ITEM_IN_TRANSIT_FOR_PICKUP'
+    assert calls == [params['item_pid']]
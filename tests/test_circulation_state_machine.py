@@ -8,13 +8,85 @@
 
 """Tests for circulation state machine logic."""
 
+import mock
 import pytest
+from invenio_records.models import RecordMetadata
 
-from invenio_circulation.errors import NoValidTransitionAvailable
+from invenio_circulation.errors import LoanConflictError, \
+    NoValidTransitionAvailable
 from invenio_circulation.proxies import current_circulation
+from invenio_circulation.signals import loan_transition_timed
 
 
 def test_invalid_transitions(loan_created, app, params):
     """Test that there are no conditional transitions at this state."""
     with pytest.raises(NoValidTransitionAvailable):
         current_circulation.circulation.trigger(loan_created, **params)
+
+
+def test_dispatch_index(app):
+    """Test that transitions are indexed by source state and trigger."""
+    circulation = current_circulation.circulation
+    for src_state, transitions in circulation.transitions.items():
+        for t in transitions:
+            assert t in circulation.dispatch_index[(src_state, t.trigger)]
+
+    pending_next = circulation.dispatch_index[('PENDING', 'next')]
+    assert [t.dest for t in pending_next] == [
+        'ITEM_AT_DESK', 'ITEM_IN_TRANSIT_FOR_PICKUP'
+    ]
+    assert ('CREATED', 'next') not in circulation.dispatch_index
+
+
+def test_trigger_evaluates_only_candidates(loan_created, app, params):
+    """Test that transitions with another trigger are not evaluated."""
+    circulation = current_circulation.circulation
+    with mock.patch.object(
+        circulation.dispatch_index[('CREATED', 'request')][0], 'execute'
+    ) as mock_request:
+        with pytest.raises(NoValidTransitionAvailable):
+            circulation.trigger(loan_created, **dict(params, trigger='cancel'))
+        assert not mock_request.called
+
+
+def test_transition_timings(loan_created, db, params, mock_is_item_available):
+    """Test the timings of the transition phases."""
+    timed = []
+
+    def receiver(sender, loan=None, timings=None):
+        timed.append((sender, loan, timings))
+
+    circulation = current_circulation.circulation
+    with loan_transition_timed.connected_to(receiver):
+        loan = circulation.trigger(
+            loan_created, **dict(params, trigger='checkout')
+        )
+    assert len(timed) == 1
+    transition, timed_loan, timings = timed[0]
+    assert transition.dest == 'ITEM_ON_LOAN'
+    assert timed_loan is loan
+    assert set(timings) == set(
+        ['before', 'after', 'commit', 'signal', 'trigger']
+    )
+    assert timings['commit'] + timings['signal'] <= timings['after']
+    assert timings['before'] + timings['after'] <= timings['trigger']
+
+    # nothing is timed without receivers
+    circulation.trigger(loan, **dict(params, trigger='extend'))
+    assert len(timed) == 1
+
+
+def test_concurrent_change_conflict(loan_created, db, params,
+                                    mock_is_item_available):
+    """Test that a loan changed by another transaction is not overwritten."""
+    # another transaction commits a new revision of the loan
+    db.session.execute(
+        RecordMetadata.__table__.update().where(
+            RecordMetadata.id == loan_created.id
+        ).values(version_id=RecordMetadata.version_id + 1)
+    )
+    with pytest.raises(LoanConflictError):
+        current_circulation.circulation.trigger(
+            loan_created, **dict(params, trigger='checkout')
+        )
+    assert loan_created['state'] == 'CREATED'
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the asynchronous dispatch of the loan state changes."""
+
+import mock
+import pytest
+from helpers import SwappedConfig
+
+from invenio_circulation.api import Loan, LoanView
+from invenio_circulation.dispatch import _EVENTS_KEY, ThreadPoolDispatcher, \
+    _supports_skip_locked, get_loan_events_dispatcher, relay_loan_events
+from invenio_circulation.models import LoanEvent
+from invenio_circulation.proxies import current_circulation
+from invenio_circulation.signals import loan_events_relayed, loan_state_changed
+
+
+@pytest.yield_fixture()
+def received():
+    """Collect the received loan state changes."""
+    received = []
+
+    def receiver(sender, loan=None):
+        received.append((sender, loan))
+
+    with loan_state_changed.connected_to(receiver):
+        yield received
+
+
+@pytest.yield_fixture()
+def committing_db(database):
+    """Database whose session commits for real, emptied after the test."""
+    yield database
+    database.session.remove()
+    database.drop_all()
+    database.create_all()
+
+
+@pytest.yield_fixture()
+def local_dispatcher(app):
+    """Dispatch the loan events to the local queue."""
+    with SwappedConfig('CIRCULATION_LOAN_EVENTS_DISPATCHER',
+                       'invenio_circulation.dispatch:LocalQueueDispatcher'):
+        yield get_loan_events_dispatcher()
+
+
+def test_loan_events_dispatched_on_commit(local_dispatcher, received,
+                                          committing_db, params,
+                                          mock_is_item_available):
+    """Test that the loan events are dispatched once committed."""
+    session = committing_db.session
+    loan = current_circulation.circulation.trigger(
+        Loan.create({}), **dict(params, trigger='checkout')
+    )
+    session.flush()
+    assert not local_dispatcher.queue
+
+    # a released savepoint hands its events over to the outer transaction
+    with session.begin_nested():
+        loan = current_circulation.circulation.trigger(
+            loan, **dict(params, trigger='extend')
+        )
+    assert not local_dispatcher.queue
+
+    session.commit()
+    assert [e['trigger'] for e in local_dispatcher.queue] == \
+        ['checkout', 'extend']
+    assert received == []
+
+    assert local_dispatcher.run() == 2
+    assert [transition.dest for transition, _ in received] == \
+        ['ITEM_ON_LOAN', 'ITEM_ON_LOAN']
+    _, loan_view = received[-1]
+    assert isinstance(loan_view, LoanView)
+    assert loan_view.id == str(loan.id)
+    assert loan_view['extension_count'] == 1
+
+
+def test_loan_events_discarded_on_rollback(local_dispatcher, received,
+                                           loan_created, db, params,
+                                           mock_is_item_available):
+    """Test that the loan events of a rolled back transaction are lost."""
+    db.session.begin_nested()
+    current_circulation.circulation.trigger(
+        loan_created, **dict(params, trigger='checkout')
+    )
+    assert any(db.session().info[_EVENTS_KEY].values())
+    db.session.rollback()
+    assert not any(db.session().info.get(_EVENTS_KEY, {}).values())
+    assert local_dispatcher.run() == 0
+    assert received == []
+
+
+def test_thread_pool_dispatcher_order(app, received):
+    """Test that the events of a loan are delivered in order."""
+    with SwappedConfig('CIRCULATION_LOAN_EVENTS_WORKERS', 2):
+        dispatcher = ThreadPoolDispatcher(app)
+    assert len(dispatcher.queues) == 2
+    events = [
+        dict(loan_id=loan_id, loan=dict(sequence=sequence),
+             src='ITEM_ON_LOAN', dest='ITEM_ON_LOAN', trigger='extend')
+        for sequence in range(20) for loan_id in ['loan_1', 'loan_2']
+    ]
+    dispatcher.dispatch(events)
+    dispatcher.join()
+
+    assert len(received) == len(events)
+    for loan_id in ['loan_1', 'loan_2']:
+        sequences = [loan['sequence'] for _, loan in received
+                     if loan.id == loan_id]
+        assert sequences == list(range(20))
+    assert all(sender.trigger == 'extend' for sender, _ in received)
+
+
+def test_outbox_relay(received, loan_created, db, params,
+                      mock_is_item_available):
+    """Test that the outbox events are relayed in batches once committed."""
+    relayed = []
+
+    def batch_receiver(sender, events=None):
+        relayed.append(events)
+
+    with SwappedConfig('CIRCULATION_LOAN_EVENTS_DISPATCHER',
+                       'invenio_circulation.dispatch:OutboxDispatcher'):
+        loan = current_circulation.circulation.trigger(
+            loan_created, **dict(params, trigger='checkout')
+        )
+        db.session.begin_nested()
+        current_circulation.circulation.trigger(
+            loan, **dict(params, trigger='cancel')
+        )
+        db.session.rollback()
+        loan = current_circulation.circulation.trigger(
+            Loan.get_record(loan.id), **dict(params, trigger='extend')
+        )
+        db.session.commit()
+        assert received == []
+        assert LoanEvent.query.count() == 2
+
+        with loan_events_relayed.connected_to(batch_receiver):
+            assert relay_loan_events(batch_size=1) == 2
+    assert [[e['trigger'] for e in events] for events in relayed] == \
+        [['checkout'], ['extend']]
+    assert [sender.trigger for sender, _ in received] == \
+        ['checkout', 'extend']
+    assert all(view.id == str(loan.id) for _, view in received)
+    assert LoanEvent.query.count() == 0
+
+
+@pytest.mark.parametrize('name, version, mariadb, expected', [
+    ('postgresql', (9, 4, 10), False, False),
+    ('postgresql', (10, 5), False, True),
+    ('mysql', (5, 7, 22), False, False),
+    ('mysql', (8, 0, 12), False, True),
+    ('mysql', (10, 3, 9), True, False),
+    ('mysql', (10, 6, 4), True, True),
+    ('sqlite', (3, 24, 0), False, False),
+])
+def test_supports_skip_locked(name, version, mariadb, expected):
+    """Test the detection of the databases able to skip locked rows."""
+    dialect = mock.Mock(server_version_info=version, _is_mariadb=mariadb)
+    dialect.name = name
+    assert _supports_skip_locked(dialect) == expected
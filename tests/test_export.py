@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for loans export."""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+from flask import url_for
+from flask.cli import ScriptInfo
+from helpers import SwappedConfig
+from invenio_records_rest.utils import allow_all
+
+from invenio_circulation.cli import circulation
+from invenio_circulation.export import export_loans
+
+
+def test_export_ndjson(indexed_loans):
+    """Test NDJSON export of all the loans."""
+    lines = list(export_loans())
+    assert len(lines) == len(indexed_loans)
+    loans = [json.loads(line) for line in lines]
+    assert set(loan['loanid'] for loan in loans) == \
+        set(loan['loanid'] for _, loan in indexed_loans)
+
+
+def test_export_csv_projection(indexed_loans):
+    """Test CSV export of some fields of the loans in a given state."""
+    lines = list(export_loans(
+        fmt='csv', fields=['item_pid', 'state'], states=['ITEM_ON_LOAN']
+    ))
+    assert lines[0].strip() == 'item_pid,state'
+    assert sorted(line.strip() for line in lines[1:]) == [
+        'item_multiple_pending_on_loan_7,ITEM_ON_LOAN',
+        'item_on_loan_2,ITEM_ON_LOAN',
+        'item_pending_on_loan_6,ITEM_ON_LOAN',
+    ]
+
+
+def test_export_invalid_format(app):
+    """Test export with an unknown format."""
+    with pytest.raises(ValueError):
+        list(export_loans(fmt='xml'))
+
+
+def test_export_endpoint(app, indexed_loans):
+    """Test the streaming export endpoint."""
+    with app.test_client() as client:
+        url = url_for('invenio_circulation.loanid_export')
+        res = client.get(url)
+        assert res.status_code == 403
+
+        with SwappedConfig('CIRCULATION_LOANS_EXPORT_PERMISSION_FACTORY',
+                           allow_all):
+            res = client.get(url, query_string=dict(format='xml'))
+            assert res.status_code == 400
+            assert 'xml' in json.loads(res.data.decode('utf-8'))['message']
+
+            res = client.get(url, query_string=dict(
+                format='csv', fields='loanid,state', state='PENDING'
+            ))
+            assert res.status_code == 200
+            assert res.mimetype == 'text/csv'
+            lines = res.get_data(as_text=True).splitlines()
+            assert lines[0] == 'loanid,state'
+            assert len(lines) == 1 + 4
+
+
+def test_export_cli(base_app, indexed_loans):
+    """Test the export command."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: base_app)
+    result = runner.invoke(
+        circulation, ['export', '--state', 'ITEM_RETURNED'], obj=script_info
+    )
+    assert result.exit_code == 0
+    loans = [json.loads(line) for line in result.output.splitlines()]
+    assert len(loans) == 3
+    assert all(loan['state'] == 'ITEM_RETURNED' for loan in loans)
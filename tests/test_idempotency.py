@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the idempotent loan actions."""
+
+import json
+from datetime import datetime, timedelta
+
+import mock
+import pytest
+from click.testing import CliRunner
+from flask import url_for
+from flask.cli import ScriptInfo
+
+from invenio_circulation.api import Loan
+from invenio_circulation.cli import circulation
+from invenio_circulation.errors import IdempotencyKeyConflictError
+from invenio_circulation.idempotency import claim_idempotency_key, \
+    request_fingerprint
+from invenio_circulation.models import IdempotencyKey
+from invenio_circulation.pid.minters import loan_pid_minter
+from invenio_circulation.proxies import current_circulation
+from invenio_circulation.views import HTTP_CODES
+
+
+def test_retried_action(app, db, json_headers, params,
+                        mock_is_item_available):
+    """Test that a retried action is not performed again."""
+    loan = Loan.create({})
+    pid = loan_pid_minter(loan.id, loan)
+    current_circulation.circulation.trigger(
+        loan, **dict(params, trigger='checkout')
+    )
+    db.session.commit()
+
+    headers = json_headers + [('Idempotency-Key', 'extend-1')]
+    with app.test_client() as client:
+        url = url_for('invenio_circulation.loanid_actions',
+                      pid_value=pid.pid_value, action='extend')
+        first = client.post(url, headers=headers, data=json.dumps(params))
+        assert first.status_code == HTTP_CODES['accepted']
+
+        retry = client.post(url, headers=headers, data=json.dumps(params))
+        assert retry.status_code == HTTP_CODES['accepted']
+        assert retry.data == first.data
+        assert Loan.get_record(loan.id)['extension_count'] == 1
+
+        other_params = dict(params, transaction_location_pid='other_loc')
+        res = client.post(url, headers=headers,
+                          data=json.dumps(other_params))
+        assert res.status_code == HTTP_CODES['unprocessable_entity']
+
+        # an expired key is used again
+        IdempotencyKey.query.get('extend-1').created = \
+            datetime.utcnow() - timedelta(days=2)
+        db.session.commit()
+        res = client.post(url, headers=headers, data=json.dumps(params))
+        assert res.status_code == HTTP_CODES['accepted']
+        assert Loan.get_record(loan.id)['extension_count'] == 2
+
+
+def test_purge_idempotency_keys(base_app, db):
+    """Test the purge of the expired idempotency keys."""
+    now = datetime.utcnow()
+    for key, created in [('old', now - timedelta(days=2)), ('new', now)]:
+        db.session.add(IdempotencyKey(
+            key=key, fingerprint='', created=created, status=202,
+            headers=[], body=b'{}',
+        ))
+    db.session.commit()
+
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: base_app)
+    result = runner.invoke(circulation, ['purge-idempotency-keys'],
+                           obj=script_info)
+    assert result.exit_code == 0
+    assert '1 idempotency keys purged.' in result.output
+    assert [row.key for row in IdempotencyKey.query] == ['new']
+
+
+def test_concurrent_claims(base_app, db):
+    """Test the claim of a key taken by a concurrent request."""
+    with base_app.test_request_context('/loan/1/extend', method='POST',
+                                       data='{}'):
+        assert claim_idempotency_key('claimed') is None
+        # the first request is still in progress
+        db.session.commit()
+        db.session.expunge_all()
+        with pytest.raises(IdempotencyKeyConflictError):
+            with mock.patch(
+                    'invenio_circulation.idempotency.get_stored_response',
+                    return_value=None):
+                claim_idempotency_key('claimed')
+
+        # the first request is committed with its response
+        row = IdempotencyKey.query.get('claimed')
+        row.status = 202
+        row.body = b'{"loanid": "1"}'
+        db.session.commit()
+        db.session.expunge_all()
+        with mock.patch(
+                'invenio_circulation.idempotency.get_stored_response',
+                side_effect=[None, mock.sentinel.stored]):
+            assert claim_idempotency_key('claimed') is mock.sentinel.stored
+
+        # a duplicate request gets the stored response
+        stored = claim_idempotency_key('claimed')
+        assert stored.status_code == 202
+        assert stored.get_data() == b'{"loanid": "1"}'
+
+
+def test_fingerprint_user(base_app):
+    """Test that the keys of different users do not match."""
+    with base_app.test_request_context('/loan/1/extend', method='POST',
+                                       data='{}'):
+        anonymous = request_fingerprint()
+        with mock.patch.object(base_app, 'login_manager', create=True), \
+                mock.patch('flask_login.utils._get_user') as get_user:
+            get_user.return_value.is_authenticated = True
+            get_user.return_value.get_id.return_value = 1
+            first_user = request_fingerprint()
+            get_user.return_value.get_id.return_value = 2
+            second_user = request_fingerprint()
+        assert len(set([anonymous, first_user, second_user])) == 3
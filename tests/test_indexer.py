@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for loans bulk indexing."""
+
+import mock
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from helpers import SwappedConfig
+from invenio_search import current_search, current_search_client
+
+from invenio_circulation.cli import circulation
+from invenio_circulation.indexer import flush_loans_indexing_queue
+from invenio_circulation.proxies import current_circulation
+from invenio_circulation.search import LoansSearch
+
+
+@mock.patch('invenio_circulation.indexer.RecordIndexer')
+def test_transitions_enqueue_loans(mock_indexer, loan_created, db, params,
+                                   mock_is_item_available):
+    """Test that loans touched by transitions are bulk indexed once."""
+    with SwappedConfig('CIRCULATION_LOANS_BULK_INDEXING', True):
+        loan = current_circulation.circulation.trigger(
+            loan_created, **dict(params, trigger='checkout')
+        )
+        loan = current_circulation.circulation.trigger(
+            loan, **dict(params, trigger='extend')
+        )
+        db.session.commit()
+        assert not mock_indexer.called
+
+        assert flush_loans_indexing_queue() == [str(loan.id)]
+        mock_indexer.return_value.bulk_index.assert_called_once_with(
+            [str(loan.id)]
+        )
+
+        # the queue is empty once flushed
+        assert flush_loans_indexing_queue() == []
+
+
+@mock.patch('invenio_circulation.indexer.RecordIndexer')
+def test_loans_indexed_outside_requests(mock_indexer, base_app, loan_created,
+                                        db, params, mock_is_item_available):
+    """Test that loans touched outside of a request are bulk indexed."""
+    with SwappedConfig('CIRCULATION_LOANS_BULK_INDEXING', True):
+        with base_app.app_context():
+            loan = current_circulation.circulation.trigger(
+                loan_created, **dict(params, trigger='checkout')
+            )
+            db.session.commit()
+            loan_id = str(loan.id)
+            assert not mock_indexer.called
+
+        # flushed when the application context is torn down
+        mock_indexer.return_value.bulk_index.assert_called_once_with(
+            [loan_id]
+        )
+
+
+@mock.patch('invenio_circulation.indexer.RecordIndexer')
+def test_bulk_indexing_disabled(mock_indexer, loan_created, db, params,
+                                mock_is_item_available):
+    """Test that nothing is queued when bulk indexing is disabled."""
+    current_circulation.circulation.trigger(
+        loan_created, **dict(params, trigger='checkout')
+    )
+    db.session.commit()
+    assert flush_loans_indexing_queue() == []
+    assert not mock_indexer.called
+
+
+def test_reindex_loans(base_app, indexed_loans):
+    """Test the reindex of the loans in a new aliased index."""
+    client = current_search_client
+    try:
+        runner = CliRunner()
+        script_info = ScriptInfo(create_app=lambda info: base_app)
+        result = runner.invoke(circulation, ['reindex', '--chunk-size', '2'],
+                               obj=script_info)
+        if current_search.cluster_version < [6, 4]:
+            # the concrete loans index is not replaced
+            assert result.exit_code != 0
+            assert 'not an alias' in result.output
+            return
+        assert result.exit_code == 0
+
+        aliases = client.indices.get_alias(index='loans-loan-v1.0.0')
+        assert len(aliases) == 1
+        index = list(aliases)[0]
+        assert index.startswith('loans-loan-v1.0.0-')
+        assert index in result.output
+        assert set(aliases[index]['aliases']) == \
+            set(['loans', 'loans-loan-v1.0.0'])
+
+        current_search.flush_and_refresh(index='loans')
+        assert LoansSearch().count() == len(indexed_loans)
+        # dates are searchable with their time
+        search = LoansSearch().filter('range', transaction_date={
+            'gte': '2018-02-01T00:00:00', 'lt': '2100-01-01T00:00:00'
+        })
+        assert search.count() > 0
+    finally:
+        client.indices.delete(index='loans-loan-v1.0.0-*')
+        list(current_search.create(ignore=[400]))
@@ -8,10 +8,12 @@
 
 """Tests for loan mandatory constraints."""
 
+import mock
 import pytest
 from helpers import SwappedConfig
 
-from invenio_circulation.errors import TransitionConstraintsViolation
+from invenio_circulation.errors import TransitionConditionsFailed, \
+    TransitionConstraintsViolation
 from invenio_circulation.proxies import current_circulation
 
 
@@ -86,3 +88,17 @@ def test_persist_loan_parameters(
     params["trigger"] = loan["trigger"]
     params["$schema"] = "https://localhost:5000/schema/loans/loan-v1.0.0.json"
     assert loan == params
+
+
+def test_trigger_validated_first(loan_created, params):
+    """Test that the item is not looked up when the trigger does not match."""
+    transition = current_circulation.circulation.dispatch_index[
+        ('CREATED', 'checkout')
+    ][0]
+    item_exists = mock.Mock(return_value=True)
+    with SwappedConfig("CIRCULATION_ITEM_EXISTS", item_exists):
+        with pytest.raises(TransitionConditionsFailed):
+            transition.before(loan_created, **dict(params, trigger="request"))
+        with pytest.raises(TransitionConstraintsViolation):
+            transition.before(loan_created, trigger="checkout")
+    assert not item_exists.called
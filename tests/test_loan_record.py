@@ -49,3 +49,14 @@ def test_state_checkout_with_loan_pid(loan_created, db, params, loan_schema,
 def test_indexed_loans(indexed_loans):
     """Test mappings, index creation and loans indexing."""
     assert indexed_loans
+
+
+def test_get_records_by_pids(test_loans):
+    """Test fetching several loans by pid with a single query."""
+    (pid1, loan1), (pid2, loan2) = test_loans[:2]
+    loans = Loan.get_records_by_pids(
+        [pid2.pid_value, 'unknown', pid1.pid_value]
+    )
+    assert [loan.id for loan in loans] == [loan2.id, loan1.id]
+    assert Loan.get_records_by_pids([]) == []
+    assert Loan.get_record_by_pid(pid1.pid_value).id == loan1.id
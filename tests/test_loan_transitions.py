@@ -12,12 +12,18 @@ from datetime import timedelta
 
 import mock
 import pytest
+from click.testing import CliRunner
 from flask import current_app
+from flask.cli import ScriptInfo
 from helpers import SwappedConfig, SwappedNestedConfig
 
-from invenio_circulation.api import Loan, is_item_available
+from invenio_circulation.api import Loan, LoanView, are_items_available, \
+    is_item_available, search_loan_views_by_pid
+from invenio_circulation.cli import circulation
 from invenio_circulation.errors import ItemNotAvailable, \
     NoValidTransitionAvailable, TransitionConstraintsViolation
+from invenio_circulation.models import LoanRequest
+from invenio_circulation.pid.minters import loan_pid_minter
 from invenio_circulation.proxies import current_circulation
 from invenio_circulation.search import LoansSearch
 from invenio_circulation.utils import parse_date
@@ -25,12 +31,12 @@ from invenio_circulation.utils import parse_date
 
 @mock.patch(
     'invenio_circulation.transitions.transitions'
-    '.get_pending_loans_by_doc_pid'
+    '.get_next_pending_loan_by_doc_pid'
 )
-def test_loan_checkout_checkin(mock_pending_loans_for_document, loan_created,
+def test_loan_checkout_checkin(mock_next_pending_loan, loan_created,
                                db, params, mock_is_item_available):
     """Test loan checkout and checkin actions."""
-    mock_pending_loans_for_document.return_value = []
+    mock_next_pending_loan.return_value = None
     assert loan_created['state'] == 'CREATED'
 
     loan = current_circulation.circulation.trigger(
@@ -89,6 +95,7 @@ def test_loan_extend(loan_created, db, params,
     # test to manny extensions
     current_app.config['CIRCULATION_POLICIES']['extension'][
         'max_count'] = get_max_count_1
+    current_circulation.reload()
     with pytest.raises(TransitionConstraintsViolation):
         loan = current_circulation.circulation.trigger(
             loan, **dict(params, trigger='extend')
@@ -106,6 +113,7 @@ def test_loan_extend_from_enddate(loan_created, db, params,
     extension_date = parse_date(loan.get('transaction_date'))
     current_app.config['CIRCULATION_POLICIES']['extension'][
         'from_end_date'] = False
+    current_circulation.reload()
 
     loan = current_circulation.circulation.trigger(
         loan, **dict(params, trigger='extend')
@@ -238,13 +246,13 @@ def test_checkout_fails_when_duration_invalid(loan_created, params,
 
 @mock.patch(
     'invenio_circulation.transitions.transitions'
-    '.get_pending_loans_by_doc_pid'
+    '.get_next_pending_loan_by_doc_pid'
 )
-def test_checkin_end_date_is_transaction_date(mock_pending_loans_for_document,
+def test_checkin_end_date_is_transaction_date(mock_next_pending_loan,
                                               loan_created, db, params,
                                               mock_is_item_available):
     """Test date the checkin date is the transaction date."""
-    mock_pending_loans_for_document.return_value = []
+    mock_next_pending_loan.return_value = None
     loan = current_circulation.circulation.trigger(
         loan_created, **dict(params,
                              start_date='2018-02-01T09:30:00+02:00',
@@ -280,6 +288,56 @@ def test_search_loans_by_pid(indexed_loans):
     assert len(loans) == 2
 
 
+def test_search_loan_views_by_pid(indexed_loans):
+    """Test read-only loans hydrated from the loans index."""
+    views = list(search_loan_views_by_pid(
+        item_pid='item_multiple_pending_on_loan_7', filter_states=['PENDING']
+    ))
+    assert len(views) == 2
+    assert all(isinstance(view, LoanView) for view in views)
+    assert set(view['patron_pid'] for view in views) == set(['1', '3'])
+
+    loan = views[0].to_loan()
+    assert isinstance(loan, Loan)
+    assert str(loan.id) == views[0].id
+    assert loan['patron_pid'] == views[0]['patron_pid']
+
+
+def test_parallel_scan(indexed_loans):
+    """Test iterating over all loans with concurrent sliced scrolls."""
+    expected = sorted(loan['loanid'] for _, loan in indexed_loans)
+    for slices in (1, 3):
+        hits = LoansSearch().parallel_scan(slices=slices, buffer_size=2)
+        assert sorted(hit.loanid for hit in hits) == expected
+
+    # stopping early does not leave the slices blocked
+    hits = LoansSearch().parallel_scan(slices=2, buffer_size=1)
+    assert next(hits).loanid in expected
+    hits.close()
+
+
+def test_parallel_scan_failure(app):
+    """Test that errors raised while scrolling a slice are propagated."""
+    with mock.patch.object(LoansSearch, 'scan',
+                           side_effect=ValueError('scroll failed')):
+        with pytest.raises(ValueError):
+            list(LoansSearch().parallel_scan(slices=2))
+
+
+def test_has_loans_by_pid(indexed_loans):
+    """Test existence check of loans belonging to an item."""
+    assert LoansSearch.has_loans_by_pid(item_pid='item_pending_1')
+    assert not LoansSearch.has_loans_by_pid(item_pid='no_loan')
+    assert not LoansSearch.has_loans_by_pid(
+        item_pid='item_returned_3',
+        exclude_states=['ITEM_RETURNED'],
+    )
+    assert LoansSearch.has_loans_by_pid(
+        item_pid='item_multiple_pending_on_loan_7',
+        filter_states=['PENDING'],
+    )
+
+
 def test_item_availibility(indexed_loans):
     """Test item_availibility with various conditions."""
     assert not is_item_available(item_pid='item_pending_1')
@@ -292,6 +350,27 @@ def test_item_availibility(indexed_loans):
     assert is_item_available(item_pid='no_loan')
 
 
+def test_are_items_available(indexed_loans):
+    """Test availability of several items resolved at once."""
+    item_pids = [
+        'item_pending_1',
+        'item_on_loan_2',
+        'item_returned_3',
+        'item_pending_on_loan_6',
+        'item_returned_6',
+        'no_loan',
+    ]
+    assert are_items_available(item_pids) == {
+        'item_pending_1': False,
+        'item_on_loan_2': False,
+        'item_returned_3': True,
+        'item_pending_on_loan_6': False,
+        'item_returned_6': True,
+        'no_loan': True,
+    }
+    assert are_items_available([]) == {}
+
+
 def test_checkout_on_unavailable_item(loan_created, db, params,
                                       mock_is_item_available):
     """Test checkout fails on unvailable item."""
@@ -309,11 +388,11 @@ def test_checkout_on_unavailable_item(loan_created, db, params,
         )
 
 
-@mock.patch('invenio_circulation.api.is_item_available')
+@mock.patch('invenio_circulation.api.are_items_available')
 def test_request_on_document_with_available_items(mock_available_item,
                                                   loan_created, db, params):
     """Test loan request action."""
-    mock_available_item.return_value = True
+    mock_available_item.return_value = {'item_pid': True}
     with SwappedConfig('CIRCULATION_ITEMS_RETRIEVER_FROM_DOCUMENT',
                        lambda x: ['item_pid']):
         loan = current_circulation.circulation.trigger(
@@ -329,11 +408,11 @@ def test_request_on_document_with_available_items(mock_available_item,
         assert loan['document_pid'] == 'document_pid'
 
 
-@mock.patch('invenio_circulation.api.is_item_available')
+@mock.patch('invenio_circulation.api.are_items_available')
 def test_request_on_document_with_unavailable_items(mock_available_item,
                                                     loan_created, db, params):
     """Test loan request action."""
-    mock_available_item.return_value = False
+    mock_available_item.return_value = {'item_pid': False}
     with SwappedConfig('CIRCULATION_ITEMS_RETRIEVER_FROM_DOCUMENT',
                        lambda x: ['item_pid']):
         # remove item_pid
@@ -351,18 +430,17 @@ def test_request_on_document_with_unavailable_items(mock_available_item,
 
 
 @mock.patch(
-    'invenio_circulation.transitions.transitions'
-    '.get_pending_loans_by_doc_pid'
+    'invenio_circulation.transitions.transitions.enqueue_loans_for_indexing'
 )
-@mock.patch('invenio_circulation.api.is_item_available')
+@mock.patch('invenio_circulation.api.are_items_available')
 def test_document_requests_on_item_returned(mock_available_item,
-                                            mock_pending_loans_for_document,
+                                            mock_enqueue_loans,
                                             mock_is_item_available,
                                             loan_created, db, params):
     """Test loan request action."""
 
     # return item is not available
-    mock_available_item.return_value = False
+    mock_available_item.return_value = {'item_pid': False}
 
     with SwappedConfig('CIRCULATION_DOCUMENT_RETRIEVER_FROM_ITEM',
                        lambda x: 'document_pid'):
@@ -379,24 +457,29 @@ def test_document_requests_on_item_returned(mock_available_item,
             db.session.commit()
             assert new_loan['state'] == 'ITEM_ON_LOAN'
 
-            # create a new loan request on document_pid without items available
-            new_loan_created = Loan.create({})
+            # create loan requests on document_pid without items available
             # remove item_pid
             params.pop('item_pid')
-            pending_loan = current_circulation.circulation.trigger(
-                new_loan_created,
-                **dict(params, trigger='request',
-                       document_pid='document_pid',
-                       pickup_location_pid='pickup_location_pid')
-            )
-            db.session.commit()
-            assert pending_loan['state'] == 'PENDING'
-            # no item available found. Request is created with no item attached
-            assert 'item_pid' not in pending_loan
-            assert pending_loan['document_pid'] == 'document_pid'
-
-            # resolve pending document requests to `document_pid`
-            mock_pending_loans_for_document.return_value = [pending_loan]
+            pending_loans = []
+            for transaction_date in ['2018-02-01T09:30:00+02:00',
+                                     '2018-02-02T09:30:00+02:00']:
+                pending_loan = current_circulation.circulation.trigger(
+                    Loan.create({}),
+                    **dict(params, trigger='request',
+                           document_pid='document_pid',
+                           pickup_location_pid='pickup_location_pid',
+                           transaction_date=transaction_date)
+                )
+                db.session.commit()
+                assert pending_loan['state'] == 'PENDING'
+                # no item available found. Request is created with no item
+                # attached
+                assert 'item_pid' not in pending_loan
+                assert pending_loan['document_pid'] == 'document_pid'
+                pending_loans.append(pending_loan)
+            assert [request.loan_id for request in
+                    LoanRequest.get_queue('document_pid')] == \
+                [loan.id for loan in pending_loans]
 
             returned_loan = current_circulation.circulation.trigger(
                 new_loan, **dict(params,
@@ -406,8 +489,37 @@ def test_document_requests_on_item_returned(mock_available_item,
             db.session.commit()
             assert returned_loan['state'] == 'ITEM_RETURNED'
 
-            # item `item_pid` has been attached to pending loan request on
-            # `document_pid` automatically
-            assert pending_loan['state'] == 'PENDING'
-            assert pending_loan['item_pid'] == 'item_pid'
-            assert pending_loan['document_pid'] == 'document_pid'
+            # item `item_pid` has been attached to the first pending loan
+            # request on `document_pid` automatically
+            first_loan, second_loan = [
+                Loan.get_record(loan.id) for loan in pending_loans
+            ]
+            assert first_loan['state'] == 'PENDING'
+            assert first_loan['item_pid'] == 'item_pid'
+            assert first_loan['document_pid'] == 'document_pid'
+            mock_enqueue_loans.assert_called_once_with([first_loan])
+
+            # the second request is still waiting for an item
+            assert 'item_pid' not in second_loan
+            assert [request.loan_id for request in
+                    LoanRequest.get_queue('document_pid')] == [second_loan.id]
+
+
+def test_rebuild_document_requests_queues(base_app, db):
+    """Test the rebuild of the document requests queues from the loans."""
+    loan = Loan.create(dict(state='PENDING', document_pid='document_pid',
+                            transaction_date='2018-02-01T09:30:00+02:00'))
+    loan_pid_minter(loan.id, loan)
+    loan.commit()
+    db.session.commit()
+    loan_id = loan.id
+    assert LoanRequest.query.get(loan_id) is None
+
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: base_app)
+    result = runner.invoke(circulation, ['rebuild-queues'], obj=script_info)
+    assert result.exit_code == 0
+    request = LoanRequest.query.get(loan_id)
+    assert request.document_pid == 'document_pid'
+    assert request.priority == 0
+    assert request.requested_at.isoformat() == '2018-02-01T07:30:00'
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the overdue loans sweep."""
+
+from datetime import datetime
+
+import mock
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from flask_sqlalchemy import BaseQuery
+
+from invenio_circulation.cli import circulation
+from invenio_circulation.models import SweepCheckpoint
+from invenio_circulation.overdue import OVERDUE_CHECKPOINT, \
+    get_overdue_loans, lock_sweep_checkpoint, sweep_overdue_loans
+from invenio_circulation.signals import loans_overdue
+
+ON_LOAN_ITEM_PIDS = [
+    'item_multiple_pending_on_loan_7',
+    'item_on_loan_2',
+    'item_pending_on_loan_6',
+]
+
+
+def test_get_overdue_loans(indexed_loans):
+    """Test the batches of loans ending in a date range."""
+    batches = list(get_overdue_loans(until=datetime(2030, 1, 1),
+                                     batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    loans = [loan for batch in batches for loan in batch]
+    assert sorted(loan['item_pid'] for loan in loans) == ON_LOAN_ITEM_PIDS
+    assert all(loan['state'] == 'ITEM_ON_LOAN' for loan in loans)
+
+    assert list(get_overdue_loans(since=datetime(2030, 1, 1),
+                                  until=datetime(2031, 1, 1))) == []
+
+
+def test_sweep_overdue_loans(db, indexed_loans):
+    """Test that each overdue loan is signaled once."""
+    signaled = []
+
+    def receiver(sender, loans=None):
+        signaled.append([loan['item_pid'] for loan in loans])
+
+    with loans_overdue.connected_to(receiver):
+        assert sweep_overdue_loans(now=datetime(2018, 1, 1)) == 0
+        assert signaled == []
+        assert SweepCheckpoint.query.get(OVERDUE_CHECKPOINT).value == \
+            datetime(2018, 1, 1)
+
+        assert sweep_overdue_loans(batch_size=2,
+                                   now=datetime(2030, 1, 1)) == 3
+        assert [len(batch) for batch in signaled] == [2, 1]
+        assert sorted(sum(signaled, [])) == ON_LOAN_ITEM_PIDS
+
+        assert sweep_overdue_loans(now=datetime(2031, 1, 1)) == 0
+        assert len(signaled) == 2
+
+
+def test_lock_sweep_checkpoint(db):
+    """Test the creation of a sweep checkpoint by concurrent sweeps."""
+    checkpoint, created = lock_sweep_checkpoint('sweep', datetime(2018, 1, 1))
+    assert created
+    db.session.commit()
+    db.session.expunge_all()
+
+    # another sweep created the checkpoint after the lookup
+    lookups = []
+
+    def one_or_none(query):
+        lookups.append(query)
+        return None if len(lookups) == 1 else original(query)
+
+    original = BaseQuery.one_or_none
+    with mock.patch.object(BaseQuery, 'one_or_none', one_or_none):
+        checkpoint, created = lock_sweep_checkpoint('sweep',
+                                                    datetime(2018, 2, 1))
+    assert not created
+    assert checkpoint.value == datetime(2018, 1, 1)
+
+
+def test_overdue_cli(base_app, db, indexed_loans):
+    """Test the overdue command."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: base_app)
+    result = runner.invoke(circulation, ['overdue'], obj=script_info)
+    assert result.exit_code == 0
+    assert '3 overdue loans signaled.' in result.output
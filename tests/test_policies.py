@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the circulation policy matrix."""
+
+import mock
+from helpers import SwappedConfig
+
+from invenio_circulation.cache import callbacks_cache
+from invenio_circulation.policies import LRUCache, PolicyMatrix
+from invenio_circulation.utils import get_default_extension_max_count, \
+    get_default_loan_duration
+
+RULES = [
+    dict(checkout_duration=30, extension_max_count=2),
+    dict(item_category='dvd', checkout_duration=7),
+    dict(location_pid='loc_pid', checkout_duration=21),
+    dict(patron_category='staff', extension_max_count=5),
+    dict(patron_category='staff', item_category='dvd', location_pid='*',
+         checkout_duration=14),
+]
+
+
+def test_policy_matrix_resolve():
+    """Test that the most specific rule giving a policy wins."""
+    matrix = PolicyMatrix(RULES)
+    assert matrix.resolve(None, None, None) == dict(
+        checkout_duration=30, extension_max_count=2
+    )
+    assert matrix.resolve('student', 'book', 'loc_pid') == dict(
+        checkout_duration=21, extension_max_count=2
+    )
+    assert matrix.resolve('student', 'dvd', 'loc_pid') == dict(
+        checkout_duration=7, extension_max_count=2
+    )
+    assert matrix.resolve('staff', 'dvd', 'loc_pid') == dict(
+        checkout_duration=14, extension_max_count=5
+    )
+    assert matrix.resolve('staff', 'book', None) == dict(
+        checkout_duration=30, extension_max_count=5
+    )
+    assert matrix.resolve('staff', 'book', None) is \
+        matrix.resolve('staff', 'book', None)
+
+
+def test_lru_cache():
+    """Test that the least recently used values are evicted."""
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert len(cache) == 2
+
+
+def test_default_policies_from_matrix(app):
+    """Test that the default policies resolve through the matrix."""
+    patron_category = mock.Mock(return_value='staff')
+    item_category = mock.Mock(return_value='dvd')
+    loan = dict(patron_pid='patron_pid', item_pid='item_pid')
+    with SwappedConfig('CIRCULATION_POLICY_MATRIX', RULES), \
+            SwappedConfig('CIRCULATION_PATRON_CATEGORY_RETRIEVER',
+                          patron_category), \
+            SwappedConfig('CIRCULATION_ITEM_CATEGORY_RETRIEVER',
+                          item_category):
+        with callbacks_cache():
+            assert get_default_loan_duration(loan) == 14
+            assert get_default_extension_max_count(loan) == 5
+        assert patron_category.call_count == 1
+        assert item_category.call_count == 1
+
+        # the categories are retrieved again by the next action
+        patron_category.return_value = 'student'
+        with callbacks_cache():
+            assert get_default_loan_duration(loan) == 7
+            assert get_default_extension_max_count(loan) == 2
+        assert patron_category.call_count == 2
+        assert item_category.call_count == 2
+
+    assert get_default_loan_duration(loan) == 30
+
+
+def test_policy_matrix_invalidate():
+    """Test that the cached policies are forgotten once invalidated."""
+    rules = [dict(checkout_duration=30)]
+    matrix = PolicyMatrix(lambda: rules)
+    assert matrix.resolve(None, None, None) == dict(checkout_duration=30)
+
+    rules = [dict(checkout_duration=60)]
+    assert matrix.resolve(None, None, None) == dict(checkout_duration=30)
+    matrix.invalidate()
+    assert matrix.resolve(None, None, None) == dict(checkout_duration=60)
+
+
+def test_unused_criteria_not_retrieved(app):
+    """Test that no retriever is called for the criteria of no rule."""
+    patron_category = mock.Mock(return_value='staff')
+    item_category = mock.Mock(return_value='dvd')
+    loan = dict(patron_pid='patron_pid', item_pid='item_pid')
+    with SwappedConfig('CIRCULATION_PATRON_CATEGORY_RETRIEVER',
+                       patron_category), \
+            SwappedConfig('CIRCULATION_ITEM_CATEGORY_RETRIEVER',
+                          item_category):
+        assert get_default_loan_duration(loan) == 30
+        assert not patron_category.called
+
+        rules = [dict(patron_category='staff', checkout_duration=60)]
+        with SwappedConfig('CIRCULATION_POLICY_MATRIX', rules):
+            assert get_default_loan_duration(loan) == 60
+            assert patron_category.call_count == 1
+            assert not item_category.called
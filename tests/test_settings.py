@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2018 CERN.
+# Copyright (C) 2018 RERO.
+#
+# Invenio-Circulation is free software; you can redistribute it and/or modify
+# it under the terms of the MIT License; see LICENSE file for more details.
+
+"""Tests for the circulation configuration snapshot."""
+
+import pytest
+from flask import current_app
+from helpers import SwappedConfig, SwappedNestedConfig
+from invenio_records_rest.utils import allow_all
+
+from invenio_circulation.proxies import current_circulation
+from invenio_circulation.settings import CirculationSettings
+from invenio_circulation.utils import get_default_loan_duration
+
+
+def test_settings_snapshot(app):
+    """Test that the snapshot is read-only and resolves import strings."""
+    settings = CirculationSettings(dict(
+        current_app.config,
+        CIRCULATION_ITEM_EXISTS='invenio_circulation.utils:item_exists',
+        CIRCULATION_LOANS_EXPORT_PERMISSION_FACTORY='invenio_records_rest'
+                                                    '.utils:allow_all',
+        CIRCULATION_POLICIES=dict(
+            checkout=dict(
+                duration_default='invenio_circulation.utils'
+                                 ':get_default_loan_duration',
+                from_end_date=False,
+            ),
+            extension=dict(calendar='library:main'),
+        ),
+    ))
+    assert settings['CIRCULATION_ITEM_EXISTS']('item_pid') is False
+    assert settings.policies['checkout']['duration_default'] is \
+        get_default_loan_duration
+    assert settings.policies['checkout']['from_end_date'] is False
+    # only the policy functions are imported
+    assert settings.policies['extension']['calendar'] == 'library:main'
+    assert settings['CIRCULATION_LOANS_EXPORT_PERMISSION_FACTORY'] is \
+        allow_all
+    assert 'ITEM_ON_LOAN' in settings.states
+    assert isinstance(settings['CIRCULATION_STATES_ITEM_AVAILABLE'], tuple)
+
+    with pytest.raises(TypeError):
+        settings['CIRCULATION_ITEM_EXISTS'] = None
+    with pytest.raises(TypeError):
+        settings.policies['checkout']['from_end_date'] = True
+
+
+def test_settings_reload(app):
+    """Test that the configuration changes are applied on reload."""
+    policies = current_circulation.settings.policies
+    with SwappedNestedConfig(
+            ['CIRCULATION_POLICIES', 'checkout', 'duration_default'],
+            lambda loan: 7):
+        duration = current_circulation.settings.policies['checkout'][
+            'duration_default']
+        assert duration(None) == 7
+    assert current_circulation.settings.policies == policies
+
+    circulation = current_circulation.circulation
+    with SwappedConfig('CIRCULATION_BULK_ACTIONS_MAX_SIZE', 1):
+        assert current_circulation.settings[
+            'CIRCULATION_BULK_ACTIONS_MAX_SIZE'] == 1
+        assert current_circulation.circulation is not circulation